@@ -0,0 +1,206 @@
+"""Проверка HTTP-загрузки тегов (FETCH_MODE=http) против локальной копии сайта.
+
+Без сети и без БД: HttpTagFetcher и AsyncTagCrawler.get_tag_data_http
+работают с bench/local_site.py, записанное собирается в памяти.
+
+    python bench/check_http_fetch.py
+
+Проверяется пагинация через ?page=N, откат на браузер (FetchError), если
+сайт игнорирует параметр страницы, и то, что откат запоминается до конца
+запуска (браузер подменен заглушкой), повтор на 429 через ограничитель
+скорости и запись копии сайта (record) с таким сайтом. Код выхода 1 -
+проверка не прошла.
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(os.path.dirname(BENCH_DIR), 'src'), BENCH_DIR]
+
+from local_site import SiteServer, SyntheticSite, record  # noqa: E402
+from crawler.async_crawler import AsyncTagCrawler  # noqa: E402
+from crawler.browser import PageTracker  # noqa: E402
+from crawler.checkpoint import CrawlCheckpoint  # noqa: E402
+from crawler.http_fetch import FetchError, HttpTagFetcher, UnsupportedPageError  # noqa: E402
+from crawler.icons import IconCache  # noqa: E402
+from crawler.pipeline import Pipeline  # noqa: E402
+from crawler.rate_limit import AdaptiveRateLimiter  # noqa: E402
+from crawler.registry import AddressRegistry  # noqa: E402
+
+TAG = 'Lending;Borrowing'
+
+
+class MemorySink:
+    """Приемник, собирающий записанные адреса в список"""
+
+    max_writers = None
+
+    def __init__(self):
+        self.rows = []
+
+    def write(self, batch):
+        self.rows.extend(batch)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class IgnoredPageSite(SyntheticSite):
+    """Сайт, который отдает первую страницу на любой ?page=N"""
+
+    def tag_page(self, tag, page):
+        return super().tag_page(tag, 1)
+
+
+def fast_limiter():
+    # Ограничитель не должен замедлять проверку сам по себе
+    return AdaptiveRateLimiter(rate=1000, max_rate=1000)
+
+
+def make_crawler(base_url, workdir, tags):
+    """AsyncTagCrawler с HTTP-загрузкой, чекпоинтом в workdir и записью в память"""
+    limiter = fast_limiter()
+    sink = MemorySink()
+    checkpoint = CrawlCheckpoint(workdir)
+    checkpoint.start(tags)
+    pipeline = Pipeline(
+        sink,
+        IconCache(cache_dir=os.path.join(workdir, 'icons'), rate_limiter=limiter),
+        AddressRegistry(data_dir=workdir, persistent=False)
+    )
+    crawler = AsyncTagCrawler(checkpoint, limiter, AddressRegistry(data_dir=workdir, persistent=False), pipeline, 1)
+    crawler.base_url = base_url
+    crawler.http_fetcher = HttpTagFetcher(base_url, limiter)
+    return crawler, sink
+
+
+async def crawl_tag(site, workdir):
+    """Тег через get_tag_data_http; возвращает (результат, записанные адреса, чекпоинт)"""
+    server = SiteServer(site)
+    crawler, sink = make_crawler(server.start(), workdir, [TAG])
+    await crawler.http_fetcher.start()
+    try:
+        try:
+            result = await crawler.get_tag_data_http(TAG)
+        except FetchError as e:
+            result = e
+        await asyncio.to_thread(crawler.pipeline.drain)
+    finally:
+        await crawler.http_fetcher.close()
+        crawler.pipeline.close()
+        server.stop()
+    return result, sink.rows, crawler.checkpoint
+
+
+async def check_pagination(workdir):
+    site = SyntheticSite([TAG], pages=3, rows=5, icons=3)
+    result, rows, checkpoint = await crawl_tag(site, workdir)
+    assert result is True, f"обход тега не завершился: {result!r}"
+    addresses = [data['address'] for data in rows]
+    assert len(addresses) == 15 and len(set(addresses)) == 15, f"ожидалось 15 разных адресов, записано {len(addresses)}"
+    assert all(data['icon_hash'] for data in rows), "не у всех адресов есть иконка"
+    assert checkpoint.remaining_tags() is None, "тег не отмечен в чекпоинте как записанный"
+
+
+async def check_ignored_page_param(workdir):
+    site = IgnoredPageSite([TAG], pages=3, rows=5, icons=3)
+    result, rows, checkpoint = await crawl_tag(site, workdir)
+    assert isinstance(result, UnsupportedPageError), f"ожидался UnsupportedPageError для отката на браузер, получено {result!r}"
+    assert len(rows) == 5, f"записана только первая страница, а не {len(rows)} адресов"
+    assert checkpoint.remaining_tags() == [TAG], "тег с откатом на браузер не должен считаться записанным"
+
+
+async def check_fallback_remembered(workdir):
+    tags = [TAG, 'DeFi']
+    server = SiteServer(IgnoredPageSite(tags, pages=3, rows=5, icons=3))
+    crawler, sink = make_crawler(server.start(), workdir, tags)
+    browser_tags = []
+
+    async def browser_tag(page, tag, checkpoint=None, last_page=None, tracker=None):
+        # Заглушка браузера: тег считается обработанным
+        browser_tags.append(tag)
+        return True
+
+    crawler.get_tag_data = browser_tag
+    worker = {'context': None, 'page': object(), 'tracker': PageTracker()}
+    await crawler.http_fetcher.start()
+    try:
+        for tag in tags:
+            await crawler.process_tag(worker, tag)
+        await asyncio.to_thread(crawler.pipeline.drain)
+    finally:
+        await crawler.http_fetcher.close()
+        crawler.pipeline.close()
+        server.stop()
+    assert browser_tags == tags, f"оба тега должны уйти в браузер, ушли {browser_tags}"
+    assert crawler.http_disabled, "прямая загрузка не отключена после сбоя пагинации"
+    assert server.requests['tag_page'] == 2, f"второй тег снова загружался по HTTP: {server.requests['tag_page']} запросов"
+
+
+def check_record_ignored_page_param(workdir):
+    server = SiteServer(IgnoredPageSite([TAG], pages=3, rows=5, icons=3))
+    base_url = server.start()
+    try:
+        record(base_url, [TAG], workdir, max_pages=3)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("record() записал копии первой страницы как страницы 2..N")
+    finally:
+        server.stop()
+
+
+async def check_throttling():
+    server = SiteServer(SyntheticSite([TAG], pages=1, rows=5, icons=3))
+    base_url = server.start()
+    limiter = fast_limiter()
+    try:
+        async with HttpTagFetcher(base_url, limiter) as fetcher:
+            server.fail_next(429, count=2, retry_after=1)
+            records, has_next = await fetcher.get_page(TAG, 1)
+            assert len(records) == 5 and not has_next, "после 429 страница не получена"
+            assert server.requests['failed'] == 2, f"ожидалось 2 ответа 429, было {server.requests['failed']}"
+            assert limiter.rate < 1000, "ограничитель не снизил скорость после 429"
+
+            # Повторы кончились - FetchError (дальше откат на браузер)
+            server.fail_next(429, count=fetcher.retries + 1)
+            try:
+                await fetcher.get_page(TAG, 1)
+            except FetchError:
+                pass
+            else:
+                raise AssertionError("ожидался FetchError после исчерпания повторов")
+    finally:
+        server.stop()
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    checks = [
+        ('пагинация', lambda: check_pagination(tempfile.mkdtemp(prefix='http-check-'))),
+        ('игнорируемый параметр страницы', lambda: check_ignored_page_param(tempfile.mkdtemp(prefix='http-check-'))),
+        ('откат на браузер запоминается', lambda: check_fallback_remembered(tempfile.mkdtemp(prefix='http-check-'))),
+        ('повтор на 429', check_throttling),
+        ('запись копии сайта', lambda: check_record_ignored_page_param(tempfile.mkdtemp(prefix='http-check-'))),
+    ]
+    failed = 0
+    for name, check in checks:
+        try:
+            result = check()
+            if asyncio.iscoroutine(result):
+                asyncio.run(result)
+            print(f"OK   {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL {name}: {e}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
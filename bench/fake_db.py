@@ -0,0 +1,171 @@
+"""Замены db.models.Database для бенчмарка.
+
+RecordingDatabase - без сервера: запросы записываются и считаются, на
+INSERT ... RETURNING в колонке id отдается последовательный id, в type -
+второе значение строки, в остальных - первое, чего достаточно AddressRepository. CountingDatabase - настоящий (одноразовый)
+Postgres с тем же подсчетом обращений к серверу.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from psycopg2.extensions import cursor as pg_cursor
+
+from db.models import Database
+
+
+class QueryStats:
+    """Число обращений к БД и записанных адресов (общие для всех соединений)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.round_trips = 0
+        self.addresses_written = 0
+        self.statements = {}
+
+    def record(self, sql, rows=0):
+        kind = ' '.join(sql.split()[:3]).upper() if sql else ''
+        with self._lock:
+            self.round_trips += 1
+            self.statements[kind] = self.statements.get(kind, 0) + 1
+            if kind.startswith('INSERT INTO ADDRESSES'):
+                self.addresses_written += rows
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'round_trips': self.round_trips,
+                'addresses_written': self.addresses_written,
+                'statements': dict(self.statements)
+            }
+
+
+def _text(sql):
+    return sql.decode('utf-8', errors='replace') if isinstance(sql, bytes) else str(sql)
+
+
+class FakeCursor:
+    """Курсор без сервера; mogrify запоминает строки для ответа на RETURNING"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._pending = []
+        self._result = []
+        self.rowcount = -1
+        self.itersize = 2000
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def mogrify(self, template, args):
+        self._pending.append(args)
+        return b'(...)'
+
+    def execute(self, sql, params=None):
+        sql = _text(sql)
+        rows, self._pending = self._pending, []
+        if 'RETURNING' in sql.upper():
+            columns = [c.strip().lower() for c in sql[sql.upper().rindex('RETURNING') + 9:].split(',')]
+            self._result = [tuple(self._returning(column, row) for column in columns) for row in rows]
+        else:
+            self._result = []
+        self.rowcount = len(rows)
+        self.connection.database.stats.record(sql, len(rows))
+
+    def _returning(self, column, row):
+        if column == 'id':
+            return self.connection.database.next_id()
+        if column == 'type':
+            return row[1] if len(row) > 1 else None
+        return row[0]
+
+    def fetchall(self):
+        result, self._result = self._result, []
+        return result
+
+    def fetchone(self):
+        return self._result.pop(0) if self._result else None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    encoding = 'UTF8'
+
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class RecordingDatabase(Database):
+    """Database без Postgres: запросы только считаются"""
+
+    def __init__(self, config=None):
+        self.maxconn = int(os.getenv('DB_POOL_MAX', '10'))
+        self.stats = QueryStats()
+        self._ids = 0
+        self._ids_lock = threading.Lock()
+
+    def next_id(self):
+        with self._ids_lock:
+            self._ids += 1
+            return self._ids
+
+    @contextmanager
+    def get_connection(self):
+        yield FakeConnection(self)
+
+
+class CountingCursor(pg_cursor):
+    """Курсор psycopg2, считающий обращения к серверу"""
+
+    stats = None
+
+    def execute(self, query, vars=None):
+        result = super().execute(query, vars)
+        if self.stats is not None:
+            self.stats.record(_text(query), max(self.rowcount, 0))
+        return result
+
+
+class CountingDatabase(Database):
+    """Настоящий Postgres (BENCH_DB_*); схема создается из bench/schema.sql, таблицы очищаются"""
+
+    def __init__(self, config):
+        self.stats = QueryStats()
+        cursor_class = type('BenchCursor', (CountingCursor,), {'stats': self.stats})
+        super().__init__({**config, 'cursor_factory': cursor_class})
+
+    def reset(self):
+        """Пустые таблицы перед прогоном"""
+        schema_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+        with open(schema_path, 'r', encoding='utf-8') as f:
+            schema = f.read()
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(schema)
+                cur.execute("""
+                    DO $$ BEGIN
+                        IF to_regclass('icons') IS NOT NULL THEN
+                            TRUNCATE icons CASCADE;
+                        END IF;
+                    END $$
+                """)
+                cur.execute("TRUNCATE address_tags, unified_addresses, tags, addresses RESTART IDENTITY CASCADE")
+            conn.commit()
+        self.stats.__init__()
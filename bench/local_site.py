@@ -0,0 +1,282 @@
+"""Локальная копия ethplorer.io для бенчмарка: /tag, /tag/{tag}?page=N и иконки.
+
+Страницы либо генерируются (SyntheticSite), либо читаются из каталога с
+записанными страницами (RecordedSite, см. record()). В обоих случаях в
+страницу добавляется скрипт, который по клику на "»" подгружает следующую
+страницу и подменяет таблицу, как это делает сайт.
+"""
+import hashlib
+import html
+import os
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse, urlsplit
+
+PAGINATION_SCRIPT = """<script>
+document.addEventListener('click', async event => {
+    const link = event.target.closest('a.page-link');
+    const href = link && link.getAttribute('href');
+    if (!href || href === '#') return;
+    event.preventDefault();
+    const page = new DOMParser().parseFromString(await (await fetch(link.href)).text(), 'text/html');
+    document.querySelector('tbody').replaceWith(page.querySelector('tbody'));
+    document.querySelector('ul.pagination').replaceWith(page.querySelector('ul.pagination'));
+});
+</script>"""
+
+
+def inject_script(body):
+    if PAGINATION_SCRIPT in body:
+        return body
+    if '</body>' in body:
+        return body.replace('</body>', PAGINATION_SCRIPT + '</body>', 1)
+    return body + PAGINATION_SCRIPT
+
+
+def tag_cloud_html(tags):
+    items = ''.join(
+        f'<div class="word-cloud-item"><a href="/tag/{quote(tag)}">{html.escape(tag)}</a></div>'
+        for tag in tags
+    )
+    return f'<html><body><div class="word-cloud">{items}</div></body></html>'
+
+
+class SyntheticSite:
+    """Детерминированные страницы тегов.
+
+    Каждая overlap_every-я строка берет адрес из общего пула, поэтому один
+    адрес встречается на страницах нескольких тегов (как на настоящем сайте).
+    """
+
+    def __init__(self, tags, pages=3, rows=50, icons=100, overlap_every=4):
+        self.tags = list(tags)
+        self.pages = pages
+        self.rows = rows
+        self.icons = icons
+        self.overlap_every = overlap_every
+        self._index = {tag: i for i, tag in enumerate(self.tags)}
+
+    def tag_cloud(self):
+        return tag_cloud_html(self.tags)
+
+    def _row(self, tag, number):
+        tags = [tag]
+        if self.overlap_every and number % self.overlap_every == 0:
+            address = f"0x{'f' * 8}{number:032x}"
+            tags.append('Shared')
+        else:
+            address = f"0x{self._index[tag]:08x}{number:032x}"
+        tag_links = ''.join(
+            f'<a class="tag__public" href="/tag/{quote(t)}"><span class="tag_name">{html.escape(t)}</span></a>'
+            for t in tags
+        )
+        return (
+            '<tr>'
+            f'<td class="tags-table-address"><a href="/address/{address}"><span class="overflow-center-elips">{address}</span></a></td>'
+            f'<td class="tags-table-token"><img class="tags-table-token-icon" src="/images/{number % self.icons}.png">'
+            f'<a href="/address/{address}">Token {number}</a></td>'
+            f'<td><span class="tags-list">{tag_links}</span></td>'
+            '</tr>'
+        )
+
+    def tag_page(self, tag, page):
+        if tag not in self._index or not 1 <= page <= self.pages:
+            return None
+        rows = ''.join(self._row(tag, (page - 1) * self.rows + i) for i in range(self.rows))
+        if page < self.pages:
+            next_item = f'<li class="page-item"><a class="page-link" href="/tag/{quote(tag)}?page={page + 1}">»</a></li>'
+        else:
+            next_item = '<li class="page-item disabled"><a class="page-link" href="#">»</a></li>'
+        return (
+            '<html><body><table class="table"><thead><tr><th>Address</th><th>Token</th><th>Tags</th></tr></thead>'
+            f'<tbody>{rows}</tbody></table>'
+            f'<ul class="pagination"><li class="page-item active"><a class="page-link" href="#">{page}</a></li>{next_item}</ul>'
+            '</body></html>'
+        )
+
+    def icon(self, name):
+        number = name.split('.')[0]
+        if not number.isdigit() or int(number) >= self.icons:
+            return None
+        # Небольшой PNG-подобный блоб, уникальный для номера
+        return b'\x89PNG\r\n\x1a\n' + hashlib.sha256(number.encode()).digest() * 16
+
+    @property
+    def total_pages(self):
+        return len(self.tags) * self.pages
+
+
+class RecordedSite:
+    """Страницы, сохраненные record(): tag/<tag>/<N>.html и images/*.
+
+    Облако тегов строится по записанным тегам, чтобы масштаб прогона
+    (срез self.tags) совпадал с тем, что увидит парсер.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tags = sorted(unquote(name) for name in os.listdir(os.path.join(directory, 'tag')))
+
+    def _read(self, *parts):
+        try:
+            with open(os.path.join(self.directory, *parts), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def tag_cloud(self):
+        return tag_cloud_html(self.tags)
+
+    def tag_page(self, tag, page):
+        if tag not in self.tags:
+            return None
+        body = self._read('tag', quote(tag, safe=''), f'{page}.html')
+        return body.decode('utf-8') if body is not None else None
+
+    def icon(self, name):
+        return self._read('images', os.path.basename(name))
+
+    @property
+    def total_pages(self):
+        return sum(len(os.listdir(os.path.join(self.directory, 'tag', quote(tag, safe='')))) for tag in self.tags)
+
+
+def record(base_url, tags, directory, max_pages=3, page_param='page'):
+    """Сохранить страницы тегов с сайта для RecordedSite (иконки - по ссылкам со страниц)"""
+    from crawler.http_fetch import build_tree, extract_rows, has_next_page
+
+    def get(url):
+        request = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.read()
+
+    os.makedirs(os.path.join(directory, 'images'), exist_ok=True)
+    for tag in tags:
+        tag_dir = os.path.join(directory, 'tag', quote(tag, safe=''))
+        os.makedirs(tag_dir, exist_ok=True)
+        previous = None
+        for page in range(1, max_pages + 1):
+            url = f"{base_url}/tag/{quote(tag)}" + (f"?{page_param}={page}" if page > 1 else '')
+            body = get(url)
+            root = build_tree(body.decode('utf-8', errors='replace'))
+            rows = extract_rows(root)
+            addresses = [row['address'] for row in rows]
+            if page > 1 and addresses == previous:
+                # Иначе страницы 2..N оказались бы копиями первой
+                raise RuntimeError(
+                    f"Сайт игнорирует параметр '{page_param}': страница {page} тега {tag} совпадает с предыдущей"
+                )
+            previous = addresses
+            with open(os.path.join(tag_dir, f'{page}.html'), 'wb') as f:
+                f.write(body)
+            for row in rows:
+                src = row.get('icon_src')
+                if not src:
+                    continue
+                path = os.path.join(directory, 'images', os.path.basename(urlparse(src).path))
+                if not os.path.exists(path):
+                    with open(path, 'wb') as f:
+                        f.write(get(src if '://' in src else f"{base_url}{src}"))
+            if not has_next_page(root):
+                break
+
+
+class SiteServer:
+    """HTTP-сервер сайта в фоновом потоке; requests - счетчики запросов по типам"""
+
+    def __init__(self, site, host='127.0.0.1', port=0):
+        self.site = site
+        self.requests = {'tag_cloud': 0, 'tag_page': 0, 'icon': 0, 'not_found': 0, 'failed': 0}
+        self._lock = threading.Lock()
+        self._faults = []
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.base_url = f"http://{host}:{self._server.server_port}"
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def fail_next(self, status, count=1, retry_after=None):
+        """Следующие count запросов страниц тегов получат status (например, 429)"""
+        with self._lock:
+            self._faults.extend([(status, retry_after)] * count)
+
+    def _take_fault(self):
+        with self._lock:
+            return self._faults.pop(0) if self._faults else None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, body, content_type, extra_headers=()):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in extra_headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                body = None
+                if url.path == '/tag':
+                    server._count('tag_cloud')
+                    body = server.site.tag_cloud()
+                    if body is not None:
+                        self._send(body.encode('utf-8'), 'text/html; charset=utf-8')
+                        return
+                elif url.path.startswith('/tag/'):
+                    fault = server._take_fault()
+                    if fault:
+                        server._count('failed')
+                        status, retry_after = fault
+                        self.send_response(status)
+                        if retry_after is not None:
+                            self.send_header('Retry-After', str(retry_after))
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    server._count('tag_page')
+                    page = parse_qs(url.query).get('page', ['1'])[0]
+                    if page.isdigit():
+                        body = server.site.tag_page(unquote(url.path[len('/tag/'):]), int(page))
+                    if body is not None:
+                        self._send(inject_script(body).encode('utf-8'), 'text/html; charset=utf-8')
+                        return
+                elif url.path.startswith('/images/'):
+                    server._count('icon')
+                    body = server.site.icon(url.path[len('/images/'):])
+                    if body is not None:
+                        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                        if self.headers.get('If-None-Match') == etag:
+                            self.send_response(304)
+                            self.send_header('ETag', etag)
+                            self.send_header('Content-Length', '0')
+                            self.end_headers()
+                            return
+                        self._send(body, 'image/png', [('ETag', etag)])
+                        return
+
+                server._count('not_found')
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='bench-site', daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,248 @@
+"""Бенчмарк парсера без обращения к ethplorer.io.
+
+Поднимает локальную копию сайта (bench/local_site.py), направляет на нее BASE_URL
+и прогоняет парсер целиком: EthplorerParser (браузер) или run_async
+(FETCH_MODE=http). БД - RecordingDatabase без сервера или одноразовый
+Postgres (--db postgres, параметры из BENCH_DB_*, а не из рабочих DB_*;
+таблицы очищаются, поэтому имя базы должно содержать "bench").
+
+Каждый масштаб (число тегов из tags.csv) выполняется в отдельном процессе
+в чистом рабочем каталоге, результаты пишутся в JSON:
+
+    python bench/run.py --scales 1,10,all --mode http
+    python bench/run.py --scales 5 --mode browser --pages 5 --rows 50
+    python bench/run.py --record bench/recorded --scales 3
+    python bench/run.py --recorded bench/recorded --scales all
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+SRC = os.path.join(ROOT, 'src')
+sys.path[:0] = [SRC, BENCH_DIR]
+
+RESULT_MARKER = 'BENCH_RESULT '
+
+
+def load_tags(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [row['tag'].strip() for row in csv.DictReader(f) if row.get('tag', '').strip()]
+
+
+def parse_scales(value, total):
+    scales = []
+    for part in value.split(','):
+        part = part.strip().lower()
+        if part:
+            scales.append(total if part == 'all' else min(int(part), total))
+    return scales
+
+
+def bench_db_config():
+    """Параметры одноразового Postgres из BENCH_DB_*; рабочую БД бенчмарк не трогает"""
+    config = {
+        'dbname': os.getenv('BENCH_DB_NAME'),
+        'user': os.getenv('BENCH_DB_USER'),
+        'password': os.getenv('BENCH_DB_PASSWORD'),
+        'host': os.getenv('BENCH_DB_HOST'),
+        'port': os.getenv('BENCH_DB_PORT')
+    }
+    if 'bench' not in (config['dbname'] or '').lower():
+        raise SystemExit(
+            f"--db postgres очищает таблицы: задайте BENCH_DB_NAME с 'bench' в имени базы "
+            f"(сейчас: {config['dbname'] or 'не задано'})"
+        )
+    return config
+
+
+def load_parser():
+    """Модуль src/parser-ethplorer-tag.py (имя с дефисом - через importlib)"""
+    spec = importlib.util.spec_from_file_location('ethplorer_parser', os.path.join(SRC, 'parser-ethplorer-tag.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scale(args):
+    """Один прогон (в дочернем процессе): парсер против локального сайта"""
+    from local_site import SiteServer, SyntheticSite, RecordedSite
+    from fake_db import CountingDatabase, RecordingDatabase
+
+    if args.recorded:
+        site = RecordedSite(os.path.abspath(args.recorded))
+        site.tags = site.tags[:args.scale]
+    else:
+        site = SyntheticSite(load_tags(args.tags_csv)[:args.scale], args.pages, args.rows, args.icons)
+    server = SiteServer(site)
+    base_url = server.start()
+
+    os.chdir(args.workdir)
+    os.makedirs('data', exist_ok=True)
+    for name in ('TEST_TAG', 'CRAWL_MODE', 'PROFILE_TAG'):
+        os.environ.pop(name, None)
+    os.environ.update({
+        'BASE_URL': base_url,
+        'FETCH_MODE': 'http' if args.mode == 'http' else 'browser',
+        'PARSER_CONCURRENCY': str(args.concurrency),
+        'OUTPUT_SINKS': 'db',
+        'ICON_CACHE_DIR': 'data/icons',
+        'METRICS_ENABLED': 'true',
+        'METRICS_PORT': '0',
+        'METRICS_LOG_SECONDS': '3600',
+        # Ограничитель скорости рассчитан на живой сайт и не должен мерить сам себя
+        'RATE_LIMIT': str(args.rate),
+        'RATE_LIMIT_MAX': str(args.rate),
+    })
+
+    from crawler.metrics import get_metrics
+
+    if args.db == 'postgres':
+        database = CountingDatabase(bench_db_config())
+        database.reset()
+    else:
+        database = RecordingDatabase()
+
+    parser_module = load_parser()
+    parser_module.Database = lambda config: database
+
+    started = time.perf_counter()
+    if args.mode == 'http' or args.concurrency > 1:
+        parser_module.run_async()
+    else:
+        parser_module.EthplorerParser().run()
+    elapsed = time.perf_counter() - started
+    server.stop()
+
+    metrics = get_metrics()
+    pages = metrics.value('pages')
+    rows = metrics.value('rows')
+    db_stats = database.stats.as_dict()
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        'tags': len(site.tags),
+        'expected_pages': site.total_pages,
+        'pages': pages,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 2) if elapsed else None,
+        'rows_per_sec': round(rows / elapsed, 2) if elapsed else None,
+        # ru_maxrss в Linux - килобайты
+        'peak_rss_kb': self_rss,
+        'peak_rss_children_kb': children_rss,
+        'db_round_trips': db_stats['round_trips'],
+        'db_round_trips_per_row': round(db_stats['round_trips'] / rows, 4) if rows else None,
+        'addresses_written': db_stats['addresses_written'],
+        'db_statements': db_stats['statements'],
+        'errors': {stage: metrics.value('errors', stage) for stage in ('navigation', 'extract', 'http', 'icon', 'db')},
+        'site_requests': dict(server.requests),
+    }
+
+
+def run_child(args, scale):
+    """Прогон масштаба в отдельном процессе: пиковый RSS не смешивается между прогонами"""
+    workdir = tempfile.mkdtemp(prefix=f'ethplorer-bench-{scale}-')
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--scale', str(scale), '--workdir', workdir]
+    for name in ('mode', 'db', 'pages', 'rows', 'icons', 'concurrency', 'rate', 'tags_csv', 'recorded'):
+        value = getattr(args, name)
+        if value is not None:
+            command += [f"--{name.replace('_', '-')}", str(value)]
+    log_path = os.path.join(workdir, 'bench.log')
+    with open(log_path, 'w', encoding='utf-8') as log:
+        completed = subprocess.run(
+            command, stdout=subprocess.PIPE, stderr=None if args.verbose else log, text=True
+        )
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"Прогон на {scale} тегов завершился с кодом {completed.returncode}, лог: {log_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1,10,all', help="число тегов из tags.csv через запятую, all - все")
+    parser.add_argument('--mode', choices=('http', 'browser'), default='http')
+    parser.add_argument('--db', choices=('fake', 'postgres'), default='fake')
+    parser.add_argument('--pages', type=int, default=3, help="страниц на тег (синтетический сайт)")
+    parser.add_argument('--rows', type=int, default=50, help="строк на странице (синтетический сайт)")
+    parser.add_argument('--icons', type=int, default=100, help="разных иконок (синтетический сайт)")
+    parser.add_argument('--concurrency', type=int, default=1, help="PARSER_CONCURRENCY")
+    parser.add_argument('--rate', type=float, default=1000, help="RATE_LIMIT для прогона, запросов/с")
+    parser.add_argument('--tags-csv', default=os.path.join(ROOT, 'tags.csv'))
+    parser.add_argument('--recorded', help="каталог с записанными страницами вместо синтетики")
+    parser.add_argument('--record', help="записать страницы с живого сайта в каталог и выйти")
+    parser.add_argument('--output', help="файл результатов (по умолчанию bench/results/<время>-<коммит>.json)")
+    parser.add_argument('--verbose', action='store_true', help="лог парсера в консоль")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--scale', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(RESULT_MARKER + json.dumps(run_scale(args)), flush=True)
+        return
+
+    tags = load_tags(args.tags_csv)
+    if args.record:
+        from local_site import record
+        scale = parse_scales(args.scales, len(tags))[-1]
+        record(os.getenv('BASE_URL', 'https://ethplorer.io'), tags[:scale], args.record, max_pages=args.pages)
+        print(f"Записано тегов: {scale} в {args.record}")
+        return
+
+    if args.db == 'postgres':
+        # Проверка до запуска дочерних процессов
+        bench_db_config()
+    if args.recorded:
+        tags = os.listdir(os.path.join(args.recorded, 'tag'))
+    results = []
+    for scale in parse_scales(args.scales, len(tags)):
+        result = run_child(args, scale)
+        results.append(result)
+        print(
+            f"{result['tags']:>4} тегов: {result['pages_per_sec']} стр/с, {result['rows_per_sec']} строк/с, "
+            f"RSS {result['peak_rss_kb'] // 1024} MB (дочерние {result['peak_rss_children_kb'] // 1024} MB), "
+            f"БД {result['db_round_trips_per_row']} запросов/строку"
+        )
+
+    revision = git_revision()
+    report = {
+        'revision': revision,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'mode': args.mode,
+        'db': args.db,
+        'site': 'recorded' if args.recorded else {'pages': args.pages, 'rows': args.rows, 'icons': args.icons},
+        'concurrency': args.concurrency,
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', f"{time.strftime('%Y%m%d-%H%M%S')}-{revision or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+-- Минимальная схема для одноразовой БД бенчмарка (то, что пишет AddressRepository)
+CREATE TABLE IF NOT EXISTS addresses (
+    id SERIAL PRIMARY KEY,
+    address TEXT NOT NULL UNIQUE,
+    name TEXT,
+    icon BYTEA,
+    icon_url TEXT
+);
+
+CREATE TABLE IF NOT EXISTS unified_addresses (
+    id SERIAL PRIMARY KEY,
+    address TEXT NOT NULL UNIQUE,
+    address_name TEXT,
+    type TEXT,
+    source TEXT
+);
+
+CREATE TABLE IF NOT EXISTS tags (
+    id SERIAL PRIMARY KEY,
+    tag TEXT NOT NULL UNIQUE,
+    type TEXT
+);
+
+CREATE TABLE IF NOT EXISTS address_tags (
+    address_id INTEGER NOT NULL REFERENCES addresses (id),
+    tag_id INTEGER NOT NULL REFERENCES tags (id),
+    PRIMARY KEY (address_id, tag_id)
+);
@@ -0,0 +1,446 @@
+import asyncio
+import json
+import logging
+import os
+
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+
+from crawler.browser import LeanBrowser
+from crawler.config import read_tags_csv
+from crawler.extract import ROWS_SCRIPT, PAGE_SIGNATURE_SCRIPT, PAGE_CHANGED_SCRIPT, parse_rows
+from crawler.http_fetch import EmptyTableError, FetchError, HttpTagFetcher, UnsupportedPageError
+from crawler.metrics import get_metrics, profile_tag
+from crawler.pipeline import TagProgress
+
+# Попыток подряд получить задание из очереди, прежде чем воркер остановится
+CLAIM_RETRIES = 5
+
+
+class AsyncTagCrawler:
+    """Параллельный обход тегов пулом асинхронных браузерных контекстов или HTTP-сессий"""
+
+    def __init__(self, checkpoint, rate_limiter, registry, pipeline, concurrency=None):
+        self.base_url = os.getenv('BASE_URL', 'https://ethplorer.io')
+        self.headless = os.getenv('PLAYWRIGHT_HEADLESS', 'true').lower() == 'true'
+        self.concurrency = concurrency or int(os.getenv('PARSER_CONCURRENCY') or '1')
+        self.checkpoint = checkpoint
+        self.rate_limiter = rate_limiter
+        self.registry = registry
+        self.pipeline = pipeline
+        self.metrics = get_metrics()
+        self.page_ready_timeout = int(os.getenv('PAGE_READY_TIMEOUT', '30000'))
+        self.failed_tags = []
+        self.logger = logging.getLogger(__name__)
+        if os.getenv('PROFILE_TAG') and self.concurrency > 1:
+            # Профилировщик записывает все корутины процесса, а не один тег
+            self.logger.warning("PROFILE_TAG задан: обход идет одним воркером")
+            self.concurrency = 1
+
+        # browser - только Playwright, http - прямые запросы с откатом на Playwright
+        self.fetch_mode = os.getenv('FETCH_MODE', 'browser').lower()
+        self.http_fetcher = None
+        # Сайт не отдает страницы тегов без браузера: до конца запуска только браузер
+        self.http_disabled = False
+        # Теги без адресов в таблице (по данным браузера)
+        self.empty_tags = set()
+
+        self.lean_browser = LeanBrowser()
+        self._browser_lock = None
+        self._playwright = None
+        self._browser = None
+
+    async def get_tags(self, page, tracker=None):
+        """Получение списка всех тегов с сайта"""
+        tags = []
+        try:
+            self.logger.info("Начинаем получение списка тегов с сайта")
+            await self.rate_limiter.acquire_async()
+            await page.goto(f"{self.base_url}/tag")
+            if tracker:
+                tracker.navigated()
+            await page.wait_for_selector('.word-cloud-item a')
+
+            for tag in await page.query_selector_all('.word-cloud-item a'):
+                tags.append((await tag.inner_text()).strip())
+
+            self.logger.info(f"Получено {len(tags)} тегов")
+            return tags
+
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении тегов: {e}")
+            return []
+
+    async def process_rows(self, tag, page, rows, processed_addresses, progress):
+        """Отдать строки страницы в конвейер; возвращает число тегов"""
+        # Только адреса, которых еще не было в обходе с такими тегами
+        rows = self.registry.filter_rows(rows, processed_addresses)
+        tag_counter = 0
+        for data in rows:
+            tag_counter += len(data['tags'])
+            self.logger.info(f"Сохранен адрес: {data['address'][:20]}... с тегами: {', '.join(data['tags'])}")
+            self.logger.debug(f"Данные адреса: {json.dumps(data, default=str)}")
+
+        # Очередь конвейера ограничена: если запись отстает, воркер ждет здесь
+        await asyncio.to_thread(self.pipeline.submit, rows, progress.page_submitted(page))
+        return tag_counter
+
+    def log_tag_summary(self, tag, pages, processed_addresses, tag_counter):
+        self.logger.info(f"[{tag}] Обработано страниц: {pages}")
+        self.logger.info(f"[{tag}] Всего уникальных адресов: {len(processed_addresses)}")
+        self.logger.info(f"[{tag}] Всего тегов сохранено: {tag_counter}")
+
+    async def get_tag_data_http(self, tag, checkpoint=None, last_page=None):
+        """Получение данных по тегу без браузера; FetchError - нужен откат на Playwright"""
+        checkpoint = checkpoint or self.checkpoint
+        processed_addresses = set()
+        tag_counter = 0
+        current_page = checkpoint.resume_page(tag)
+        previous_first = None
+
+        self.logger.info(f"Начинаем обработку тега (HTTP): {tag}")
+        if current_page > 1:
+            self.logger.info(f"Продолжаем тег {tag} со страницы {current_page}")
+
+        progress = TagProgress(tag, checkpoint)
+        completed = False
+        try:
+            while True:
+                with self.metrics.timer('http'):
+                    rows, has_next = await self.http_fetcher.get_page(tag, current_page)
+                self.metrics.count('pages')
+                self.metrics.count('rows', len(rows))
+
+                # Сервер проигнорировал параметр страницы и вернул ту же таблицу
+                first = rows[0]['address'] if rows else None
+                if current_page > 1 and first is not None and first == previous_first:
+                    raise UnsupportedPageError(f"Пагинация через параметр '{self.http_fetcher.page_param}' не работает")
+                previous_first = first
+
+                tag_counter += await self.process_rows(tag, current_page, rows, processed_addresses, progress)
+
+                if not has_next:
+                    self.logger.info(f"[{tag}] Достигнут конец страниц")
+                    break
+                if last_page and current_page >= last_page:
+                    self.logger.info(f"[{tag}] Достигнут конец диапазона страниц")
+                    break
+                current_page += 1
+                self.logger.info(f"[{tag}] Переход на страницу {current_page}")
+            completed = True
+        finally:
+            progress.close(completed)
+
+        self.log_tag_summary(tag, current_page, processed_addresses, tag_counter)
+        return True
+
+    async def get_tag_data(self, page, tag, checkpoint=None, last_page=None, tracker=None):
+        """Получение данных по конкретному тегу (та же пагинация, что и в синхронном парсере)"""
+        checkpoint = checkpoint or self.checkpoint
+        processed_addresses = set()
+        tag_counter = 0
+        current_page = 1
+        progress = TagProgress(tag, checkpoint)
+
+        self.logger.info(f"Начинаем обработку тега: {tag}")
+        await self.rate_limiter.acquire_async()
+        with self.metrics.timer('navigation'):
+            await page.goto(f"{self.base_url}/tag/{tag}")
+            if tracker:
+                tracker.navigated()
+            # Ждем, пока в таблице появятся строки с адресами (а не заглушки)
+            try:
+                await page.wait_for_function(PAGE_CHANGED_SCRIPT, arg='', timeout=self.page_ready_timeout)
+            except PlaywrightTimeoutError:
+                # Пустой или удаленный тег - не ошибка, иначе он навсегда остался бы в чекпоинте
+                self.logger.warning(f"[{tag}] В таблице нет адресов, тег считается пустым")
+                self.empty_tags.add(tag)
+                progress.close(True)
+                return True
+
+        start_page = checkpoint.resume_page(tag)
+        if start_page > 1:
+            self.logger.info(f"Продолжаем тег {tag} со страницы {start_page}")
+
+        completed = False
+        try:
+            while True:
+                # Страницы до сохраненной в чекпоинте только пролистываем
+                if current_page >= start_page:
+                    # Все строки страницы одним вызовом evaluate
+                    with self.metrics.timer('extract'):
+                        rows = parse_rows(await page.evaluate(ROWS_SCRIPT), self.base_url)
+                    self.metrics.count('pages')
+                    self.metrics.count('rows', len(rows))
+                    tag_counter += await self.process_rows(tag, current_page, rows, processed_addresses, progress)
+
+                if last_page and current_page >= last_page:
+                    self.logger.info(f"[{tag}] Достигнут конец диапазона страниц")
+                    completed = True
+                    break
+
+                # Обработка пагинации
+                next_button = await page.query_selector(
+                    'li.page-item:not(.disabled) a.page-link:has-text("»")'
+                )
+                if not next_button:
+                    self.logger.info(f"[{tag}] Достигнут конец страниц")
+                    completed = True
+                    break
+
+                try:
+                    # Ждем, пока таблица действительно сменится, а не фиксированную паузу
+                    previous = await page.evaluate(PAGE_SIGNATURE_SCRIPT)
+                    await self.rate_limiter.acquire_async()
+                    with self.metrics.timer('navigation'):
+                        await next_button.click()
+                        current_page += 1
+                        if tracker:
+                            tracker.navigated()
+                        self.logger.info(f"[{tag}] Переход на страницу {current_page}")
+                        await page.wait_for_function(PAGE_CHANGED_SCRIPT, arg=previous, timeout=self.page_ready_timeout)
+                except Exception as e:
+                    self.logger.error(f"[{tag}] Ошибка пагинации: {e}")
+                    break
+        finally:
+            progress.close(completed)
+
+        self.log_tag_summary(tag, current_page, processed_addresses, tag_counter)
+        if tracker:
+            self.logger.info(f"[{tag}] Трафик браузера: {tracker.describe()}")
+        return completed
+
+    async def get_browser(self):
+        """Браузер запускается только когда он действительно нужен"""
+        async with self._browser_lock:
+            if self._browser is None:
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(
+                    **self.lean_browser.launch_options(self.headless)
+                )
+            return self._browser
+
+    async def new_page(self):
+        """Контекст, страница и счетчик трафика (облегченный режим - BROWSER_LEAN)"""
+        browser = await self.get_browser()
+        context = await browser.new_context(**self.lean_browser.context_options())
+        page = await context.new_page()
+        page.on("response", self.rate_limiter.response_listener(self.base_url))
+        tracker = await self.lean_browser.setup_async(context, page)
+        return context, page, tracker
+
+    async def process_tag(self, worker, tag, checkpoint=None, last_page=None):
+        """Тег через HTTP, при неудаче - через страницу браузера воркера"""
+        empty_html = False
+        if self.http_fetcher and not self.http_disabled:
+            try:
+                return await self.get_tag_data_http(tag, checkpoint, last_page)
+            except EmptyTableError as e:
+                # Пустой тег или таблица на скриптах - решит браузер
+                self.logger.warning(f"[{tag}] Прямая загрузка не удалась, переходим на браузер: {e}")
+                empty_html = True
+            except UnsupportedPageError as e:
+                self.disable_http(e)
+            except FetchError as e:
+                self.logger.warning(f"[{tag}] Прямая загрузка не удалась, переходим на браузер: {e}")
+
+        if worker['page'] is not None and worker['tracker'].expired:
+            # Пересоздание между тегами ограничивает рост памяти браузера
+            self.logger.info(f"Страница браузера пересоздается: {worker['tracker'].describe()}")
+            await worker['context'].close()
+            worker['page'] = None
+        if worker['page'] is None:
+            worker['context'], worker['page'], worker['tracker'] = await self.new_page()
+        done = await self.get_tag_data(worker['page'], tag, checkpoint, last_page, worker['tracker'])
+        if empty_html and done and tag not in self.empty_tags:
+            # Браузер нашел строки, которых нет в HTML: таблица рендерится скриптами
+            self.disable_http(EmptyTableError(f"Строки тега {tag} есть только в браузере"))
+        return done
+
+    def disable_http(self, reason):
+        """Прямая загрузка страниц тегов не подходит сайту - до конца запуска браузер"""
+        if not self.http_disabled:
+            self.http_disabled = True
+            self.logger.warning(f"Прямая загрузка страниц тегов отключена до конца запуска: {reason}")
+
+    async def worker(self, worker_id, claim):
+        """Воркер: свой контекст и страница; claim() - следующий тег или None.
+
+        claim возвращает (тег, задание очереди или None для файлового чекпоинта).
+        """
+        worker = {'context': None, 'page': None, 'tracker': None}
+        claim_errors = 0
+        try:
+            while True:
+                try:
+                    job = await claim()
+                except Exception as e:
+                    # Сбой БД при взятии задания не должен ронять воркер (и весь gather)
+                    claim_errors += 1
+                    if claim_errors > CLAIM_RETRIES:
+                        self.logger.error(f"[воркер {worker_id}] Не удалось получить задание, воркер остановлен: {e}")
+                        break
+                    delay = min(2 ** claim_errors, 30)
+                    self.logger.error(f"[воркер {worker_id}] Ошибка получения задания: {e}, повтор через {delay} с")
+                    await asyncio.sleep(delay)
+                    continue
+                claim_errors = 0
+                if job is None:
+                    break
+                tag, item = job
+
+                try:
+                    with profile_tag(tag):
+                        done = await self.process_tag(worker, tag, item, item.last_page if item else None)
+                    if done:
+                        self.logger.info(f"[воркер {worker_id}] Обработан тег {tag}")
+                    else:
+                        self.failed_tags.append(tag)
+                except Exception as e:
+                    # Ошибка одного тега не останавливает воркер
+                    self.logger.error(f"[воркер {worker_id}] Ошибка обработки тега {tag}: {e}")
+                    self.failed_tags.append(tag)
+                    done = False
+                if not done and item:
+                    try:
+                        await asyncio.to_thread(item.release)
+                    except Exception as e:
+                        # Задание вернется в очередь по истечении аренды
+                        self.logger.error(f"[воркер {worker_id}] Ошибка возврата задания {item}: {e}")
+        finally:
+            if worker['context']:
+                await worker['context'].close()
+
+    async def load_tags(self):
+        """Список тегов: по HTTP, при неудаче - через браузер"""
+        if self.http_fetcher:
+            try:
+                tags = await self.http_fetcher.get_tags()
+                self.logger.info(f"Получено {len(tags)} тегов")
+                return tags
+            except FetchError as e:
+                self.logger.warning(f"Прямая загрузка тегов не удалась, переходим на браузер: {e}")
+        context, page, tracker = await self.new_page()
+        try:
+            return await self.get_tags(page, tracker)
+        finally:
+            await context.close()
+
+    async def load_queue_tags(self):
+        """Теги для заполнения очереди: с сайта (QUEUE_SEED=site) или из tags.csv"""
+        tags = []
+        if os.getenv('QUEUE_SEED', 'site').lower() == 'site':
+            tags = await self.load_tags()
+        if not tags:
+            tags = list(read_tags_csv())
+        return tags
+
+    async def start(self):
+        self._browser_lock = asyncio.Lock()
+        if self.fetch_mode == 'http':
+            self.http_fetcher = HttpTagFetcher(self.base_url, self.rate_limiter)
+            await self.http_fetcher.start()
+
+    async def stop(self):
+        if self.http_fetcher:
+            await self.http_fetcher.close()
+        if self._browser:
+            await self._browser.close()
+            await self._playwright.stop()
+
+    async def crawl_queue(self, work_queue):
+        """Обход тегов из общей очереди в Postgres (CRAWL_MODE=queue)"""
+        loop = asyncio.get_running_loop()
+
+        def load_tags():
+            # seed() вызывает загрузку из своего потока, пока держит блокировку очереди
+            return asyncio.run_coroutine_threadsafe(self.load_queue_tags(), loop).result()
+
+        async def claim():
+            while True:
+                item = await asyncio.to_thread(work_queue.claim)
+                if item is not None:
+                    break
+                if not await asyncio.to_thread(work_queue.unfinished):
+                    return None
+                # Оставшиеся задания держат другие реплики (или другие воркеры): ждем
+                # завершения или истечения аренды, поток пула при этом не занимаем
+                self.logger.debug(f"Свободных заданий нет, повтор через {work_queue.poll_seconds} с")
+                await asyncio.sleep(work_queue.poll_seconds)
+            self.logger.info(f"Взято задание: {item}")
+            return item.tag, item
+
+        await self.start()
+        try:
+            while True:
+                wait = await asyncio.to_thread(work_queue.seed, load_tags)
+                if not wait:
+                    break
+                self.logger.info(f"Обход завершен недавно, следующий через {wait:.0f} с")
+                await asyncio.sleep(wait)
+
+            workers = [asyncio.create_task(self.worker(i, claim)) for i in range(self.concurrency)]
+            await asyncio.gather(*workers)
+            await asyncio.to_thread(self.pipeline.drain)
+            if self.failed_tags:
+                self.logger.warning(f"Теги с ошибками (возвращены в очередь): {', '.join(self.failed_tags)}")
+            self.logger.info("Очередь пуста. Завершение работы.")
+        finally:
+            await self.stop()
+
+    async def crawl(self, tags=None):
+        """Обход тегов N параллельными воркерами"""
+        await self.start()
+        try:
+            resumable = tags is None
+            if resumable:
+                tags = self.checkpoint.remaining_tags()
+                if tags is None:
+                    tags = await self.load_tags()
+                    self.checkpoint.start(tags)
+                    self.registry.reset()
+                else:
+                    self.logger.info("Продолжаем прерванный обход по чекпоинту")
+
+            self.logger.info(f"Найдено тегов: {len(tags)}, воркеров: {self.concurrency}, загрузка: {self.fetch_mode}")
+            if not tags:
+                self.logger.info("Теги не найдены. Завершение работы.")
+                return
+
+            queue = asyncio.Queue()
+            for tag in tags:
+                queue.put_nowait(tag)
+
+            async def claim():
+                try:
+                    return queue.get_nowait(), None
+                except asyncio.QueueEmpty:
+                    return None
+
+            workers = [
+                asyncio.create_task(self.worker(i, claim))
+                for i in range(min(self.concurrency, len(tags)))
+            ]
+            await asyncio.gather(*workers)
+            # Теги считаются готовыми только после записи конвейером
+            await asyncio.to_thread(self.pipeline.drain)
+            self.failed_tags += [tag for tag in self.checkpoint.unwritten_tags() if tag not in self.failed_tags]
+
+            if self.failed_tags:
+                # Необработанные теги останутся в чекпоинте до следующего запуска
+                # (до CHECKPOINT_MAX_ATTEMPTS попыток)
+                self.logger.warning(f"Теги с ошибками: {', '.join(self.failed_tags)}")
+                if resumable:
+                    self.checkpoint.record_failures(self.failed_tags)
+            if resumable and self.checkpoint.remaining_tags() is None:
+                # Все теги записаны или убраны после исчерпания попыток
+                self.registry.reset()
+                self.checkpoint.finish()
+            self.logger.info("Все теги обработаны. Завершение работы.")
+        finally:
+            await self.stop()
+
+    def run(self, tags=None):
+        asyncio.run(self.crawl(tags))
+
+    def run_queue(self, work_queue):
+        asyncio.run(self.crawl_queue(work_queue))
@@ -0,0 +1,140 @@
+import logging
+import os
+from urllib.parse import urlsplit
+
+from crawler.metrics import get_metrics
+
+# Аналитика и реклама: на данные страницы тега не влияют
+DEFAULT_BLOCK_DOMAINS = (
+    'google-analytics.com,googletagmanager.com,doubleclick.net,googlesyndication.com,'
+    'googleadservices.com,facebook.net,facebook.com,hotjar.com,mc.yandex.ru,'
+    'cloudflareinsights.com,twitter.com,coinzilla.com,bmcdn6.com'
+)
+
+# Лишние для headless-обхода фоновые службы Chromium
+LEAN_CHROMIUM_ARGS = [
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-domain-reliability',
+    '--disable-extensions',
+    '--disable-sync',
+    '--disable-translate',
+    '--metrics-recording-only',
+    '--mute-audio',
+    '--no-first-run',
+    '--disable-dev-shm-usage',
+]
+
+
+class PageTracker:
+    """Счетчики одной страницы браузера: переходы и принятые байты"""
+
+    def __init__(self, recycle_after=0):
+        self.recycle_after = recycle_after
+        self.navigations = 0
+        self.bytes = 0
+        self.metrics = get_metrics()
+
+    def navigated(self):
+        """Переход на тег или на следующую страницу таблицы"""
+        self.navigations += 1
+        self.metrics.count('browser_navigations')
+
+    def on_loading_finished(self, event):
+        """Network.loadingFinished из CDP: размер ответа вместе с заголовками"""
+        size = int(event.get('encodedDataLength') or 0)
+        self.bytes += size
+        self.metrics.count('browser_bytes', size)
+
+    @property
+    def expired(self):
+        """Страницу пора пересоздать (ограничение роста памяти)"""
+        return bool(self.recycle_after) and self.navigations >= self.recycle_after
+
+    def describe(self):
+        per_navigation = self.bytes / self.navigations / 1024 if self.navigations else 0
+        return f"переходов {self.navigations}, {per_navigation:.1f} КБ на переход"
+
+
+class LeanBrowser:
+    """Облегченный режим Chromium для обхода (BROWSER_LEAN).
+
+    Картинки, шрифты, медиа и запросы к доменам аналитики отклоняются
+    перехватом запросов: иконки все равно скачиваются отдельно через
+    context.request/IconCache. Страница с контекстом пересоздается между
+    тегами после BROWSER_RECYCLE_NAVIGATIONS переходов, чтобы память
+    браузера не росла на многочасовом обходе.
+    """
+
+    def __init__(self):
+        self.lean = os.getenv('BROWSER_LEAN', 'true').lower() == 'true'
+        self.block_types = {
+            name.strip().lower()
+            for name in os.getenv('BROWSER_BLOCK_TYPES', 'image,media,font').split(',') if name.strip()
+        }
+        self.block_domains = tuple(
+            name.strip().lower().lstrip('.')
+            for name in os.getenv('BROWSER_BLOCK_DOMAINS', DEFAULT_BLOCK_DOMAINS).split(',') if name.strip()
+        )
+        self.recycle_after = int(os.getenv('BROWSER_RECYCLE_NAVIGATIONS', '200'))
+        self.metrics = get_metrics()
+        self.logger = logging.getLogger(__name__)
+
+    def launch_options(self, headless):
+        options = {'headless': headless}
+        if self.lean:
+            options['args'] = list(LEAN_CHROMIUM_ARGS)
+        return options
+
+    def context_options(self):
+        # Service worker мог бы отдавать ответы в обход перехвата
+        return {'service_workers': 'block'} if self.lean else {}
+
+    def blocked(self, request):
+        if request.resource_type in self.block_types:
+            return True
+        if self.block_domains:
+            host = urlsplit(request.url).hostname or ''
+            return any(host == domain or host.endswith('.' + domain) for domain in self.block_domains)
+        return False
+
+    def _route_sync(self, route):
+        if self.blocked(route.request):
+            self.metrics.count('browser_blocked')
+            route.abort()
+        else:
+            route.continue_()
+
+    async def _route_async(self, route):
+        if self.blocked(route.request):
+            self.metrics.count('browser_blocked')
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def setup_sync(self, context, page):
+        """Перехват запросов и учет трафика для страницы синхронного API"""
+        if self.lean and (self.block_types or self.block_domains):
+            context.route('**/*', self._route_sync)
+        tracker = PageTracker(self.recycle_after)
+        try:
+            cdp = context.new_cdp_session(page)
+            cdp.send('Network.enable')
+            cdp.on('Network.loadingFinished', tracker.on_loading_finished)
+        except Exception as e:
+            self.logger.debug(f"Учет трафика браузера недоступен: {e}")
+        return tracker
+
+    async def setup_async(self, context, page):
+        """То же для асинхронного API"""
+        if self.lean and (self.block_types or self.block_domains):
+            await context.route('**/*', self._route_async)
+        tracker = PageTracker(self.recycle_after)
+        try:
+            cdp = await context.new_cdp_session(page)
+            await cdp.send('Network.enable')
+            cdp.on('Network.loadingFinished', tracker.on_loading_finished)
+        except Exception as e:
+            self.logger.debug(f"Учет трафика браузера недоступен: {e}")
+        return tracker
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import threading
+
+
+class CrawlCheckpoint:
+    """Прогресс обхода на диске в data/: оставшиеся теги и последняя завершенная страница.
+
+    Список оставшихся тегов лежит в TAGS_FILE (по строке на тег), номера
+    страниц - в checkpoint.json. После полного обхода оба файла удаляются,
+    и следующий запуск начинает обход заново.
+
+    Тег, не обработанный за CHECKPOINT_MAX_ATTEMPTS запусков подряд,
+    убирается из чекпоинта, чтобы обход не застревал на нем (счетчик
+    попыток тоже хранится в checkpoint.json).
+    """
+
+    def __init__(self, data_dir='data'):
+        self.tags_path = os.path.join(data_dir, os.getenv('TAGS_FILE', 'remaining_tags.txt').strip())
+        self.state_path = os.path.join(data_dir, 'checkpoint.json')
+        self.max_attempts = int(os.getenv('CHECKPOINT_MAX_ATTEMPTS') or '3')
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._remaining = []
+        self._pages = {}
+        # Неудачные запуски по тегу
+        self._attempts = {}
+        # Страницы, записанные раньше предыдущих (конвейер пишет не по порядку)
+        self._ahead = {}
+        # Теги этого запуска, у которых не все страницы удалось записать
+        self._unwritten = set()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.tags_path, 'r', encoding='utf-8') as f:
+                self._remaining = [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            self._remaining = []
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self._pages = state.get('pages', {})
+            self._attempts = state.get('attempts', {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._pages = {}
+            self._attempts = {}
+
+    def _write(self, path, content):
+        """Атомарная запись: временный файл + rename"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _save(self):
+        self._write(self.tags_path, ''.join(f"{tag}\n" for tag in self._remaining))
+        self._write(self.state_path, json.dumps(
+            {'pages': self._pages, 'attempts': self._attempts}, ensure_ascii=False
+        ))
+
+    def remaining_tags(self):
+        """Теги прерванного обхода или None, если сохраненного обхода нет"""
+        with self._lock:
+            return list(self._remaining) if self._remaining else None
+
+    def start(self, tags):
+        """Начало нового обхода"""
+        with self._lock:
+            self._remaining = list(tags)
+            self._pages = {}
+            self._attempts = {}
+            self._ahead = {}
+            self._save()
+
+    def resume_page(self, tag):
+        """Страница, с которой продолжать тег (1 - с начала)"""
+        with self._lock:
+            return self._pages.get(tag, 0) + 1
+
+    def page_done(self, tag, page):
+        """Страница тега полностью записана; сохраняется последняя страница без пропусков"""
+        with self._lock:
+            last = self._pages.get(tag, 0)
+            if page <= last:
+                return
+            ahead = self._ahead.setdefault(tag, set())
+            ahead.add(page)
+            while last + 1 in ahead:
+                last += 1
+                ahead.remove(last)
+            if last > self._pages.get(tag, 0):
+                self._pages[tag] = last
+                self._save()
+
+    def tag_done(self, tag):
+        """Тег обработан целиком"""
+        with self._lock:
+            if tag in self._remaining:
+                self._remaining.remove(tag)
+            self._pages.pop(tag, None)
+            self._attempts.pop(tag, None)
+            self._ahead.pop(tag, None)
+            self._save()
+
+    def tag_failed(self, tag):
+        """Тег пройден, но записан не весь: остается в чекпоинте до следующего запуска"""
+        with self._lock:
+            self._unwritten.add(tag)
+        self.logger.warning(f"Тег {tag} записан не полностью и останется в чекпоинте")
+
+    def unwritten_tags(self):
+        with self._lock:
+            return sorted(self._unwritten)
+
+    def record_failures(self, tags):
+        """Запуск закончился с ошибками по tags: тегам засчитывается попытка.
+
+        Исчерпавшие CHECKPOINT_MAX_ATTEMPTS попыток теги убираются из
+        чекпоинта; возвращает список убранных.
+        """
+        dropped = []
+        with self._lock:
+            for tag in tags:
+                if tag not in self._remaining:
+                    continue
+                attempts = self._attempts.get(tag, 0) + 1
+                if attempts >= self.max_attempts:
+                    self._remaining.remove(tag)
+                    self._pages.pop(tag, None)
+                    self._attempts.pop(tag, None)
+                    self._ahead.pop(tag, None)
+                    dropped.append(tag)
+                else:
+                    self._attempts[tag] = attempts
+            self._save()
+        for tag in dropped:
+            self.logger.error(f"Тег {tag} не обработан за {self.max_attempts} попыток и убран из чекпоинта")
+        return dropped
+
+    def finish(self):
+        """Обход завершен: следующий запуск начнет сначала"""
+        with self._lock:
+            self._remaining = []
+            self._pages = {}
+            self._attempts = {}
+            self._ahead = {}
+            for path in (self.tags_path, self.state_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
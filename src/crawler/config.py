@@ -0,0 +1,42 @@
+import csv
+import logging
+import os
+
+
+def setup_logging():
+    """Настройка логирования парсера (файл в data/ и консоль)"""
+    logging.basicConfig(
+        level=getattr(logging, os.getenv('PARSER_LOG_LEVEL', 'INFO')),
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(f"data/{os.getenv('LOG_FILE', 'parser.log')}"),
+            logging.StreamHandler()
+        ]
+    )
+
+
+def db_config_from_env():
+    """Параметры подключения к БД из переменных окружения"""
+    return {
+        'dbname': os.getenv('DB_NAME'),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD'),
+        'host': os.getenv('DB_HOST'),
+        'port': os.getenv('DB_PORT')
+    }
+
+
+def read_tags_csv(path=None):
+    """Теги и их типы из tags.csv (колонки: tag, тип); файла нет - пустой словарь"""
+    path = path or os.getenv('TAGS_CSV', 'tags.csv')
+    tags = {}
+    try:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if row and row[0].strip():
+                    tags[row[0].strip()] = row[1].strip() if len(row) > 1 and row[1].strip() else None
+    except FileNotFoundError:
+        logging.getLogger(__name__).warning(f"Файл тегов {path} не найден")
+    return tags
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+
+from playwright.async_api import async_playwright
+
+from crawler.browser import LeanBrowser
+from crawler.extract import ADDRESS_SCRIPT, parse_address
+from crawler.metrics import get_metrics
+
+
+class AddressEnricher:
+    """Дообогащение адресов со страниц /address/<адрес> (CRAWL_MODE=enrich).
+
+    Берет из БД адреса без имени или иконки (и обогащенные раньше
+    ENRICH_MAX_AGE_SECONDS) и обходит их ENRICH_CONCURRENCY страницами
+    браузера параллельно. Иконки качает общий IconCache конвейера, запись -
+    пачками по ENRICH_BATCH_SIZE через тот же Pipeline, что и у обхода тегов.
+    """
+
+    def __init__(self, address_repository, rate_limiter, pipeline, concurrency=None):
+        self.base_url = os.getenv('BASE_URL', 'https://ethplorer.io')
+        self.headless = os.getenv('PLAYWRIGHT_HEADLESS', 'true').lower() == 'true'
+        self.concurrency = concurrency or int(os.getenv('ENRICH_CONCURRENCY') or os.getenv('PARSER_CONCURRENCY') or '4')
+        self.batch_size = int(os.getenv('ENRICH_BATCH_SIZE', '50'))
+        self.max_age_seconds = int(os.getenv('ENRICH_MAX_AGE_SECONDS', '0'))
+        self.limit = int(os.getenv('ENRICH_LIMIT', '0'))
+        self.page_ready_timeout = int(os.getenv('PAGE_READY_TIMEOUT', '30000'))
+        self.address_repository = address_repository
+        self.rate_limiter = rate_limiter
+        self.pipeline = pipeline
+        self.lean_browser = LeanBrowser()
+        self.metrics = get_metrics()
+        self.logger = logging.getLogger(__name__)
+        self.stats = {'enriched': 0, 'failed': 0}
+
+        self._batch = []
+        self._playwright = None
+        self._browser = None
+
+    @staticmethod
+    def merge(known, found):
+        """Найденное на странице поверх записанного: пустое значение не затирает известное"""
+        return {
+            'address': known['address'],
+            'name': found['name'] or known.get('name') or '',
+            'icon_url': found['icon_url'] or known.get('icon_url'),
+            'tags': found['tags']
+        }
+
+    async def new_page(self):
+        context = await self._browser.new_context(**self.lean_browser.context_options())
+        page = await context.new_page()
+        page.on("response", self.rate_limiter.response_listener(self.base_url))
+        tracker = await self.lean_browser.setup_async(context, page)
+        return context, page, tracker
+
+    async def enrich_address(self, page, tracker, known):
+        """Данные адреса с его страницы, слитые с уже записанными"""
+        await self.rate_limiter.acquire_async()
+        with self.metrics.timer('navigation'):
+            await page.goto(f"{self.base_url}/address/{known['address']}")
+            tracker.navigated()
+            await page.wait_for_load_state('networkidle', timeout=self.page_ready_timeout)
+        with self.metrics.timer('extract'):
+            found = parse_address(known['address'], await page.evaluate(ADDRESS_SCRIPT), self.base_url)
+        return self.merge(known, found)
+
+    def submit(self, rows):
+        """Пачка в конвейер; после записи адреса отмечаются обогащенными.
+
+        Незаписанные адреса (failed) не отмечаются и будут взяты в следующий раз;
+        пропущенные как неизмененные - отмечаются.
+        """
+        addresses = [data['address'] for data in rows]
+
+        def on_done(failed=None):
+            written = [address for address in addresses if address not in (failed or ())]
+            try:
+                self.address_repository.mark_enriched(written)
+            except Exception as e:
+                self.logger.error(f"Ошибка отметки обогащенных адресов: {e}")
+
+        self.pipeline.submit(rows, on_done=on_done)
+
+    async def flush(self):
+        batch, self._batch = self._batch, []
+        if batch:
+            await asyncio.to_thread(self.submit, batch)
+
+    async def worker(self, worker_id, pending):
+        """Воркер со своей страницей; pending - общий итератор адресов"""
+        context = page = tracker = None
+        try:
+            for known in pending:
+                if page is not None and tracker.expired:
+                    self.logger.info(f"[воркер {worker_id}] Страница браузера пересоздается: {tracker.describe()}")
+                    await context.close()
+                    page = None
+                if page is None:
+                    context, page, tracker = await self.new_page()
+
+                try:
+                    data = await self.enrich_address(page, tracker, known)
+                except Exception as e:
+                    # Адрес не отмечается обогащенным и будет взят в следующий раз
+                    self.logger.error(f"[воркер {worker_id}] Ошибка обогащения адреса {known['address']}: {e}")
+                    self.stats['failed'] += 1
+                    continue
+
+                self.stats['enriched'] += 1
+                self.metrics.count('enriched')
+                self._batch.append(data)
+                if len(self._batch) >= self.batch_size:
+                    await self.flush()
+        finally:
+            if context:
+                await context.close()
+
+    async def enrich(self):
+        addresses = await asyncio.to_thread(
+            self.address_repository.addresses_to_enrich, self.max_age_seconds, self.limit
+        )
+        self.logger.info(f"Адресов для обогащения: {len(addresses)}")
+        if not addresses:
+            return
+
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(**self.lean_browser.launch_options(self.headless))
+        try:
+            pending = iter(addresses)
+            await asyncio.gather(*(
+                self.worker(worker_id, pending)
+                for worker_id in range(min(self.concurrency, len(addresses)))
+            ))
+            await self.flush()
+            await asyncio.to_thread(self.pipeline.drain)
+        finally:
+            await self._browser.close()
+            await self._playwright.stop()
+        self.logger.info(f"Обогащение завершено: адресов {self.stats['enriched']}, ошибок {self.stats['failed']}")
+
+    def run(self):
+        asyncio.run(self.enrich())
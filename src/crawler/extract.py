@@ -0,0 +1,113 @@
+import json
+import logging
+
+# Извлечение всех строк таблицы тега за один вызов page.evaluate.
+# Теги разрешаются так же, как раньше поэлементно: текст .tag_name,
+# затем атрибут data-tag, затем часть href после /tag/.
+ROWS_SCRIPT = """
+() => JSON.stringify(Array.from(document.querySelectorAll('tbody tr')).map(row => {
+    const text = el => el ? (el.innerText || el.textContent || '').trim() : '';
+    const address = text(row.querySelector('.tags-table-address .overflow-center-elips'));
+    const container = row.querySelector('span.tags-list');
+    let tags = null;
+    if (container) {
+        tags = [];
+        for (const t of container.querySelectorAll('.tag__public')) {
+            let tag = text(t.querySelector('.tag_name'));
+            let source = 'text';
+            if (!tag) {
+                tag = (t.getAttribute('data-tag') || '').trim();
+                source = 'data-tag';
+            }
+            if (!tag) {
+                const href = t.getAttribute('href');
+                if (href && href.includes('/tag/')) {
+                    tag = href.split('/tag/').pop().split('?')[0].trim();
+                    source = 'href';
+                }
+            }
+            if (tag) {
+                tags.push([tag, source]);
+            }
+        }
+    }
+    const icon = row.querySelector('.tags-table-token-icon');
+    return {
+        address: address,
+        name: text(row.querySelector('.tags-table-token a')),
+        icon_src: icon ? icon.getAttribute('src') : null,
+        tags: tags
+    };
+}))
+"""
+
+# Подпись текущей страницы - адреса всех строк таблицы
+PAGE_SIGNATURE_SCRIPT = """
+() => Array.from(document.querySelectorAll('tbody tr .tags-table-address .overflow-center-elips'))
+    .map(el => (el.innerText || el.textContent || '').trim()).join('|')
+"""
+
+# Готовность после перехода: таблица не пуста и отличается от предыдущей страницы
+PAGE_CHANGED_SCRIPT = """
+previous => {
+    const signature = Array.from(document.querySelectorAll('tbody tr .tags-table-address .overflow-center-elips'))
+        .map(el => (el.innerText || el.textContent || '').trim()).join('|');
+    return signature !== '' && signature !== previous;
+}
+"""
+
+
+# Страница адреса (/address/<адрес>): имя, иконка и теги одним вызовом page.evaluate
+ADDRESS_SCRIPT = """
+() => {
+    const text = el => el ? (el.innerText || el.textContent || '').trim() : '';
+    const icon = document.querySelector('.tags-table-token-icon');
+    return {
+        name: text(document.querySelector('.address-name-text')),
+        icon_src: icon ? icon.getAttribute('src') : null,
+        tags: Array.from(document.querySelectorAll('.tag-item')).map(text).filter(tag => tag)
+    };
+}
+"""
+
+
+def resolve_icon_url(icon_src, base_url):
+    """Абсолютный URL иконки"""
+    if not icon_src:
+        return None
+    if icon_src.startswith('/'):
+        return f"{base_url}{icon_src}"
+    return icon_src
+
+
+def parse_rows(payload, base_url):
+    """Разбор JSON из ROWS_SCRIPT (или уже разобранного списка) в список словарей адресов.
+
+    Строки без адреса отбрасываются; у строки без контейнера тегов tags = None.
+    """
+    logger = logging.getLogger(__name__)
+    records = []
+    for row in json.loads(payload) if isinstance(payload, str) else payload:
+        if not row.get('address'):
+            continue
+        tags = row.get('tags')
+        if tags is not None:
+            for tag, source in tags:
+                logger.debug(f"Тэг найден: {tag} | Источник: {source}")
+        records.append({
+            'address': row['address'],
+            'name': row.get('name') or '',
+            'icon_url': resolve_icon_url(row.get('icon_src'), base_url),
+            'tags': [tag for tag, _ in tags] if tags is not None else None
+        })
+    return records
+
+
+def parse_address(address, payload, base_url):
+    """Словарь адреса из результата ADDRESS_SCRIPT (в формате parse_rows)"""
+    return {
+        'address': address,
+        'name': payload.get('name') or '',
+        'icon_url': resolve_icon_url(payload.get('icon_src'), base_url),
+        'tags': list(dict.fromkeys(payload.get('tags') or []))
+    }
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import os
+import time
+from html.parser import HTMLParser
+from urllib.parse import quote
+
+import aiohttp
+
+from crawler.extract import parse_rows
+
+# Элементы без закрывающего тега
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+}
+
+
+class FetchError(Exception):
+    """Прямая загрузка не удалась - нужен браузер"""
+
+
+class UnsupportedPageError(FetchError):
+    """Сайт отдает страницы, которые без браузера не обойти (пагинация, таблица
+    на скриптах): прямую загрузку до конца запуска пробовать не стоит"""
+
+
+class EmptyTableError(UnsupportedPageError):
+    """В HTML первой страницы тега нет строк: таблица на скриптах или тег пуст"""
+
+
+class Node:
+    """Узел упрощенного DOM-дерева"""
+
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.attrs = dict(attrs)
+        self.parent = parent
+        self.children = []
+
+    @property
+    def classes(self):
+        return (self.attrs.get('class') or '').split()
+
+    def iter(self):
+        """Обход потомков в глубину (в порядке документа)"""
+        for child in self.children:
+            if isinstance(child, Node):
+                yield child
+                yield from child.iter()
+
+    def find_all(self, tag=None, cls=None):
+        return [
+            node for node in self.iter()
+            if (tag is None or node.tag == tag) and (cls is None or cls in node.classes)
+        ]
+
+    def find(self, tag=None, cls=None):
+        for node in self.iter():
+            if (tag is None or node.tag == tag) and (cls is None or cls in node.classes):
+                return node
+        return None
+
+    def text(self):
+        parts = []
+        for child in self.children:
+            parts.append(child.text() if isinstance(child, Node) else child)
+        return ' '.join(''.join(parts).split())
+
+
+class TreeBuilder(HTMLParser):
+    """Построение дерева Node из HTML стандартным html.parser"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node('#document', [])
+        self._stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, attrs, self._stack[-1])
+        self._stack[-1].children.append(node)
+        if tag not in VOID_ELEMENTS:
+            self._stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self._stack[-1].children.append(Node(tag, attrs, self._stack[-1]))
+
+    def handle_endtag(self, tag):
+        # Незакрытые элементы (li, p, td) закрываются вместе с родителем
+        for i in range(len(self._stack) - 1, 0, -1):
+            if self._stack[i].tag == tag:
+                del self._stack[i:]
+                return
+
+    def handle_data(self, data):
+        self._stack[-1].children.append(data)
+
+
+def build_tree(html):
+    builder = TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def extract_rows(root):
+    """Строки таблицы тега в том же виде, что возвращает ROWS_SCRIPT"""
+    rows = []
+    for tbody in root.find_all('tbody'):
+        for row in tbody.find_all('tr'):
+            address_cell = row.find(cls='tags-table-address')
+            address_element = address_cell.find(cls='overflow-center-elips') if address_cell else None
+
+            tags = None
+            container = row.find('span', 'tags-list')
+            if container:
+                tags = []
+                for t in container.find_all(cls='tag__public'):
+                    name_element = t.find(cls='tag_name')
+                    tag = name_element.text() if name_element else ''
+                    source = 'text'
+                    if not tag:
+                        tag = (t.attrs.get('data-tag') or '').strip()
+                        source = 'data-tag'
+                    if not tag:
+                        href = t.attrs.get('href')
+                        if href and '/tag/' in href:
+                            tag = href.split('/tag/')[-1].split('?')[0].strip()
+                            source = 'href'
+                    if tag:
+                        tags.append([tag, source])
+
+            token_cell = row.find(cls='tags-table-token')
+            name_element = token_cell.find('a') if token_cell else None
+            icon = row.find(cls='tags-table-token-icon')
+            rows.append({
+                'address': address_element.text() if address_element else '',
+                'name': name_element.text() if name_element else '',
+                'icon_src': icon.attrs.get('src') if icon else None,
+                'tags': tags
+            })
+    return rows
+
+
+def has_next_page(root):
+    """Есть ли активная ссылка «»» в пагинации"""
+    for link in root.find_all('a', 'page-link'):
+        if '»' not in link.text():
+            continue
+        item = link.parent
+        while item is not None and item.tag != 'li':
+            item = item.parent
+        if item is not None and 'page-item' in item.classes and 'disabled' not in item.classes:
+            return True
+    return False
+
+
+def parse_tag_page(html, base_url):
+    """Разбор серверного HTML страницы тега: (записи адресов, есть ли следующая страница)"""
+    root = build_tree(html)
+    return parse_rows(extract_rows(root), base_url), has_next_page(root)
+
+
+def parse_tag_cloud(html):
+    """Список тегов со страницы /tag"""
+    root = build_tree(html)
+    tags = []
+    for item in root.find_all(cls='word-cloud-item'):
+        for link in item.find_all('a'):
+            if link.text():
+                tags.append(link.text())
+    return tags
+
+
+class HttpTagFetcher:
+    """Загрузка страниц тегов без браузера через общий keep-alive пул aiohttp"""
+
+    def __init__(self, base_url, rate_limiter, pool_size=None, timeout=None):
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.retries = 3
+        self.pool_size = pool_size or int(os.getenv('HTTP_POOL_SIZE', '32'))
+        self.timeout = timeout or float(os.getenv('HTTP_TIMEOUT', '30'))
+        self.page_param = os.getenv('HTTP_PAGE_PARAM', 'page')
+        self.logger = logging.getLogger(__name__)
+        self.session = None
+
+    async def start(self):
+        """Одна сессия с пулом keep-alive соединений на весь обход"""
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'User-Agent': 'Mozilla/5.0'}
+        )
+
+    async def close(self):
+        await self.session.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def get_html(self, url):
+        """HTML страницы; на 429/503 ждем по ограничителю скорости и повторяем"""
+        for attempt in range(self.retries + 1):
+            await self.rate_limiter.acquire_async()
+            started = time.monotonic()
+            try:
+                async with self.session.get(url) as response:
+                    html = await response.text()
+                    retry_after = response.headers.get('Retry-After')
+                    self.rate_limiter.record(
+                        response.status,
+                        time.monotonic() - started,
+                        float(retry_after) if retry_after and retry_after.isdigit() else None
+                    )
+                    if response.status == 200:
+                        return html
+                    if response.status not in (429, 503) or attempt == self.retries:
+                        raise FetchError(f"HTTP {response.status} для {url}")
+                    self.logger.warning(f"HTTP {response.status} для {url}, повтор {attempt + 1}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise FetchError(f"Ошибка запроса {url}: {e}") from e
+
+    async def get_tags(self):
+        tags = parse_tag_cloud(await self.get_html(f"{self.base_url}/tag"))
+        if not tags:
+            raise FetchError("На странице /tag нет списка тегов")
+        return tags
+
+    async def get_page(self, tag, page):
+        """Записи страницы page тега и признак следующей страницы"""
+        url = f"{self.base_url}/tag/{quote(tag)}"
+        if page > 1:
+            url = f"{url}?{self.page_param}={page}"
+        records, has_next = parse_tag_page(await self.get_html(url), self.base_url)
+        if page == 1 and not records:
+            # Таблица рендерится скриптами - без браузера не обойтись
+            raise EmptyTableError(f"В HTML страницы тега {tag} нет строк таблицы")
+        return records, has_next
@@ -0,0 +1,290 @@
+import hashlib
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+from crawler.metrics import get_metrics
+
+# Иконка, адресуемая по содержимому: hash = sha256 от байтов
+Icon = namedtuple('Icon', ['url', 'hash', 'data', 'content_type'])
+
+# Ограничение размера иконки (как и раньше, до 1MB)
+MAX_ICON_BYTES = 1_000_000
+
+# Переходов по редиректам на одну иконку
+MAX_REDIRECTS = 5
+
+# Обрыв keep-alive соединения, закрытого сервером между запросами
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class IconCache:
+    """Кэш иконок по URL: LRU в памяти + файлы на диске с ревалидацией ETag/Last-Modified.
+
+    Каждый URL за обход загружается (или ревалидируется) не более одного раза,
+    одинаковые иконки хранятся на диске один раз по хешу содержимого.
+    Каждый поток загрузки держит постоянные (keep-alive) соединения к хостам
+    иконок, так что TCP/TLS-рукопожатие не повторяется на каждую иконку.
+    """
+
+    def __init__(self, cache_dir=None, max_items=None, workers=None, timeout=15, rate_limiter=None):
+        self.cache_dir = cache_dir or os.getenv('ICON_CACHE_DIR', 'data/icons')
+        self.max_items = max_items or int(os.getenv('ICON_CACHE_SIZE', '1024'))
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.logger = logging.getLogger(__name__)
+        self.metrics = get_metrics()
+
+        self._index_path = os.path.join(self.cache_dir, 'index.json')
+        self._index = self._load_index()
+        self._memory = OrderedDict()
+        self._validated = {}
+        self._inflight = {}
+        self._dirty = 0
+        self._lock = threading.Lock()
+        # Соединения потока загрузки: (схема, хост) -> HTTPConnection
+        self._local = threading.local()
+        self._connections = []
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or int(os.getenv('ICON_WORKERS', '8')),
+            thread_name_prefix='icon'
+        )
+        self.stats = {'downloaded': 0, 'not_modified': 0, 'cached': 0, 'failed': 0}
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_index(self):
+        """Атомарная запись индекса URL -> хеш/ETag/Last-Modified"""
+        with self._lock:
+            snapshot = json.dumps(self._index)
+            self._dirty = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(snapshot)
+        os.replace(tmp_path, self._index_path)
+
+    def _blob_path(self, icon_hash):
+        return os.path.join(self.cache_dir, icon_hash[:2], icon_hash)
+
+    def _remember(self, icon):
+        """Положить иконку в LRU (вызывается под блокировкой)"""
+        self._memory[icon.url] = icon
+        self._memory.move_to_end(icon.url)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _cached(self, url, entry):
+        """Иконка из памяти или с диска по записи индекса"""
+        with self._lock:
+            icon = self._memory.get(url)
+            if icon and icon.hash == entry['hash']:
+                self._memory.move_to_end(url)
+                return icon
+        try:
+            with open(self._blob_path(entry['hash']), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        icon = Icon(url, entry['hash'], data, entry.get('content_type'))
+        with self._lock:
+            self._remember(icon)
+        return icon
+
+    def _store(self, url, data, headers):
+        """Сохранение скачанной иконки на диск и в индекс"""
+        icon_hash = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(icon_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        icon = Icon(url, icon_hash, data, headers.get('Content-Type'))
+        with self._lock:
+            self._index[url] = {
+                'hash': icon_hash,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'content_type': icon.content_type
+            }
+            self._remember(icon)
+            self._dirty += 1
+            dirty = self._dirty
+        if dirty >= 100:
+            self.save_index()
+        return icon
+
+    def _connection(self, scheme, netloc):
+        """Постоянное соединение текущего потока к хосту; второе значение - новое ли оно"""
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get((scheme, netloc))
+        if conn is not None:
+            return conn, False
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        elif scheme == 'http':
+            conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        else:
+            raise ValueError(f"Неподдерживаемая схема URL: {scheme}")
+        connections[(scheme, netloc)] = conn
+        with self._lock:
+            self._connections.append(conn)
+        return conn, True
+
+    def _drop_connection(self, scheme, netloc):
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+            with self._lock:
+                self._connections.remove(conn)
+
+    def _request(self, url, headers):
+        """GET по постоянному соединению с переходом по редиректам: (статус, заголовки, тело)"""
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+            while True:
+                conn, new = self._connection(parts.scheme, parts.netloc)
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read(MAX_ICON_BYTES + 1)
+                    break
+                except STALE_CONNECTION_ERRORS:
+                    # Сервер закрыл простаивавшее соединение - повтор по новому
+                    self._drop_connection(parts.scheme, parts.netloc)
+                    if new:
+                        raise
+                except Exception:
+                    self._drop_connection(parts.scheme, parts.netloc)
+                    raise
+            if not response.isclosed():
+                # Тело прочитано не до конца (слишком большая иконка): соединение не переиспользовать
+                self._drop_connection(parts.scheme, parts.netloc)
+
+            location = response.headers.get('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            return response.status, response.headers, data
+        raise http.client.HTTPException(f"Слишком много редиректов: {url}")
+
+    def _fetch(self, url):
+        """Загрузка или ревалидация одной иконки"""
+        with self._lock:
+            entry = self._index.get(url)
+
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        started = time.monotonic()
+        try:
+            status, response_headers, data = self._request(url, headers)
+            latency = time.monotonic() - started
+            self.metrics.observe('icon', latency)
+            if self.rate_limiter:
+                self.rate_limiter.record(status, latency)
+
+            if 200 <= status < 300:
+                if len(data) > MAX_ICON_BYTES:
+                    self.logger.warning(f"Иконка слишком большая: {url}")
+                    self.stats['failed'] += 1
+                    return None
+                self.stats['downloaded'] += 1
+                return self._store(url, data, response_headers)
+
+            if status == 304 and entry:
+                icon = self._cached(url, entry)
+                if icon:
+                    self.stats['not_modified'] += 1
+                    return icon
+                # Файл пропал с диска - качаем заново без условных заголовков
+                with self._lock:
+                    self._index.pop(url, None)
+                return self._fetch(url)
+            self.logger.error(f"Ошибка при получении иконки {url}: HTTP {status}")
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении иконки {url}: {e}")
+
+        self.stats['failed'] += 1
+        self.metrics.error('icon')
+        return None
+
+    def _complete(self, url, future):
+        with self._lock:
+            self._inflight.pop(url, None)
+            icon = None if future.exception() else future.result()
+            self._validated[url] = icon.hash if icon else None
+
+    def submit(self, url):
+        """Future с иконкой; повторные запросы того же URL за обход не идут в сеть"""
+        with self._lock:
+            if url in self._inflight:
+                return self._inflight[url]
+            validated = url in self._validated
+            icon_hash = self._validated.get(url)
+
+        if validated:
+            future = Future()
+            icon = None
+            if icon_hash:
+                icon = self._cached(url, {'hash': icon_hash, 'content_type': self._index.get(url, {}).get('content_type')})
+                self.stats['cached'] += 1
+            future.set_result(icon)
+            return future
+
+        with self._lock:
+            if url in self._inflight:
+                return self._inflight[url]
+            future = self._executor.submit(self._fetch, url)
+            self._inflight[url] = future
+        future.add_done_callback(lambda f: self._complete(url, f))
+        return future
+
+    def prefetch(self, urls):
+        """Фоновая загрузка иконок страницы"""
+        for url in urls:
+            if url:
+                self.submit(url)
+
+    def get(self, url):
+        """Иконка по URL (блокирующий вызов) или None"""
+        try:
+            return self.submit(url).result()
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении иконки {url}: {e}")
+            return None
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self.save_index()
+        self.logger.info(
+            f"Иконки: скачано {self.stats['downloaded']}, не изменилось {self.stats['not_modified']}, "
+            f"из кэша {self.stats['cached']}, ошибок {self.stats['failed']}"
+        )
@@ -0,0 +1,262 @@
+import bisect
+import contextlib
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы гистограмм задержек, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metrics:
+    """Счетчики и гистограммы задержек по стадиям обхода.
+
+    Стадии: navigation (переходы браузера), extract (разбор таблицы),
+    http (страница без браузера), icon, db, file. Отдаются в формате
+    Prometheus на METRICS_PORT и раз в METRICS_LOG_SECONDS пишутся в лог.
+    """
+
+    def __init__(self, port=None, log_seconds=None):
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._started = time.monotonic()
+        self._last_report = (self._started, {}, {})
+        self._stop = threading.Event()
+
+        self._server = None
+        port = port if port is not None else int(os.getenv('METRICS_PORT', '9108'))
+        if port:
+            self._server = ThreadingHTTPServer(('0.0.0.0', port), self._handler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+            self.logger.info(f"Метрики доступны на порту {port}")
+
+        self.log_seconds = log_seconds or float(os.getenv('METRICS_LOG_SECONDS', '60'))
+        self._reporter = threading.Thread(target=self._report_loop, name='metrics-log', daemon=True)
+        self._reporter.start()
+
+    def count(self, name, n=1, stage=None):
+        key = (name, stage)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def error(self, stage):
+        self.count('errors', stage=stage)
+
+    def value(self, name, stage=None):
+        with self._lock:
+            return self._counters.get((name, stage), 0)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                # [счетчики по корзинам + inf, сумма, количество]
+                histogram = self._histograms[stage] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Время блока в гистограмму стадии; исключение считается ошибкой стадии"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.error(stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def gauge(self, name, getter):
+        """Текущее значение, которое читается при выдаче метрик"""
+        with self._lock:
+            self._gauges[name] = getter
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {stage: (list(h[0]), h[1], h[2]) for stage, h in self._histograms.items()}
+            gauges = dict(self._gauges)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE ethplorer_{name}_total counter")
+            for (counter, stage), value in sorted(counters.items(), key=lambda item: str(item[0])):
+                if counter == name:
+                    label = f'{{stage="{stage}"}}' if stage else ''
+                    lines.append(f"ethplorer_{name}_total{label} {value}")
+
+        if histograms:
+            lines.append("# TYPE ethplorer_stage_seconds histogram")
+        for stage, (buckets, total, number) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, value in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += value
+                lines.append(f'ethplorer_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'ethplorer_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'ethplorer_stage_seconds_count{{stage="{stage}"}} {number}')
+
+        for name, getter in sorted(gauges.items()):
+            try:
+                value = getter()
+            except Exception:
+                continue
+            lines.append(f"# TYPE ethplorer_{name} gauge")
+            lines.append(f"ethplorer_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def _handler(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def summary(self):
+        """Строка для лога: скорость с прошлого отчета и средние задержки стадий"""
+        now = time.monotonic()
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {stage: (h[1], h[2]) for stage, h in self._histograms.items()}
+            last_time, last_counters, last_histograms = self._last_report
+            self._last_report = (now, counters, histograms)
+
+        elapsed = max(now - last_time, 1e-9)
+        parts = []
+        for name in ('pages', 'rows'):
+            total = counters.get((name, None), 0)
+            rate = (total - last_counters.get((name, None), 0)) / elapsed
+            parts.append(f"{name} {total} ({rate:.2f}/с)")
+        navigations = counters.get(('browser_navigations', None), 0)
+        if navigations:
+            kilobytes = counters.get(('browser_bytes', None), 0) / 1024
+            parts.append(f"браузер {kilobytes / navigations:.1f} КБ/переход")
+        for stage, (total, number) in sorted(histograms.items()):
+            last_total, last_number = last_histograms.get(stage, (0.0, 0))
+            if number > last_number:
+                parts.append(f"{stage} {(total - last_total) / (number - last_number):.3f}с")
+        errors = {stage: value for (name, stage), value in counters.items() if name == 'errors'}
+        if errors:
+            parts.append("ошибки " + ', '.join(f"{stage}={value}" for stage, value in sorted(errors.items())))
+        return "Метрики: " + '; '.join(parts)
+
+    def _report_loop(self):
+        while not self._stop.wait(self.log_seconds):
+            self.logger.info(self.summary())
+
+    def close(self):
+        self._stop.set()
+        self.logger.info(self.summary())
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class NullMetrics:
+    """Метрики выключены: все вызовы пустые"""
+
+    _timer = contextlib.nullcontext()
+
+    def count(self, name, n=1, stage=None):
+        pass
+
+    def error(self, stage):
+        pass
+
+    def value(self, name, stage=None):
+        return 0
+
+    def observe(self, stage, seconds):
+        pass
+
+    def timer(self, stage):
+        return self._timer
+
+    def gauge(self, name, getter):
+        pass
+
+    def close(self):
+        pass
+
+
+_metrics = NullMetrics()
+
+
+def setup_metrics():
+    """Включение метрик по METRICS_ENABLED (вызывается один раз при старте)"""
+    global _metrics
+    if os.getenv('METRICS_ENABLED', 'false').lower() == 'true' and isinstance(_metrics, NullMetrics):
+        _metrics = Metrics()
+    return _metrics
+
+
+def get_metrics():
+    return _metrics
+
+
+@contextlib.contextmanager
+def profile_tag(tag):
+    """Профилирование обработки одного тега: PROFILE_TAG=<тег>, PROFILER=cprofile|pyinstrument.
+
+    Профилировщик видит весь процесс, поэтому асинхронный обход с PROFILE_TAG
+    идет одним воркером (см. AsyncTagCrawler), иначе в профиль попали бы
+    параллельные теги.
+    """
+    if not tag or tag != os.getenv('PROFILE_TAG'):
+        yield
+        return
+
+    logger = logging.getLogger(__name__)
+    safe_name = ''.join(c if c.isalnum() else '_' for c in tag)
+    profiler_name = (os.getenv('PROFILER') or 'cprofile').lower()
+    if profiler_name == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            # pyinstrument - необязательная зависимость (нет в requirements.txt)
+            logger.warning("pyinstrument не установлен, профиль снимается cProfile")
+            profiler_name = 'cprofile'
+
+    if profiler_name == 'pyinstrument':
+        profiler = Profiler(async_mode='enabled')
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            path = f"data/profile-{safe_name}.html"
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            logger.info(f"Профиль тега {tag} сохранен в {path}")
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = f"data/profile-{safe_name}.prof"
+            profiler.dump_stats(path)
+            logger.info(f"Профиль тега {tag} сохранен в {path}")
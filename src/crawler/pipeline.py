@@ -0,0 +1,232 @@
+import logging
+import os
+import queue
+import threading
+
+from crawler.metrics import get_metrics
+
+# Маркер остановки воркеров
+_STOP = object()
+
+
+class PageJob:
+    """Строки одной страницы и колбэк после их записи"""
+
+    def __init__(self, rows, on_done=None):
+        self.rows = rows
+        self.on_done = on_done
+
+
+class TagProgress:
+    """Прогресс записи тега: страницы идут в чекпоинт по мере записи,
+    тег считается готовым только когда записаны все его страницы.
+
+    Страница, записанная не полностью, в чекпоинт не попадает, а тег
+    вместо tag_done получает tag_failed и будет обработан повторно.
+    """
+
+    def __init__(self, tag, checkpoint):
+        self.tag = tag
+        self.checkpoint = checkpoint
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._closed = False
+        self._completed = False
+        self._failed = False
+
+    def page_submitted(self, page):
+        """Колбэк для Pipeline.submit: страница page записана; failed - незаписанные адреса"""
+        with self._lock:
+            self._pending += 1
+
+        def on_done(failed=None):
+            if failed:
+                self.logger.error(
+                    f"Страница {page} тега {self.tag} записана не полностью "
+                    f"(не записано адресов: {len(failed)}), чекпоинт не сдвигается"
+                )
+            else:
+                self.checkpoint.page_done(self.tag, page)
+            with self._lock:
+                self._pending -= 1
+                self._failed = self._failed or bool(failed)
+                fire = self._closed and self._completed and self._pending == 0
+            if fire:
+                self._finish()
+
+        return on_done
+
+    def close(self, completed):
+        """Скрапинг тега закончен; completed - дошли ли до последней страницы"""
+        with self._lock:
+            self._closed = True
+            self._completed = completed
+            fire = completed and self._pending == 0
+        if fire:
+            self._finish()
+
+    def _finish(self):
+        # Вызывается и из finally обхода тега: ошибка отметки (например, БД
+        # очереди недоступна) не должна выходить наружу и ронять обход
+        try:
+            if self._failed:
+                self.checkpoint.tag_failed(self.tag)
+            else:
+                self.checkpoint.tag_done(self.tag)
+                self.logger.info(f"Тег {self.tag} записан полностью")
+        except Exception as e:
+            self.logger.error(f"Ошибка отметки завершения тега {self.tag}: {e}")
+
+
+class Pipeline:
+    """Конвейер скрапер -> загрузка иконок -> запись в приемник на ограниченных очередях.
+
+    Браузер только отдает строки страниц в submit(); иконки и запись (БД,
+    NDJSON-файл или оба, см. crawler.sinks) выполняются в фоновых потоках. Полные очереди блокируют submit(), так
+    скрапер не убегает вперед отстающей записи.
+    """
+
+    def __init__(self, sink, icon_cache, registry, icon_workers=None, db_workers=None, queue_size=None):
+        self.sink = sink
+        self.icon_cache = icon_cache
+        self.registry = registry
+        self.batch_size = int(os.getenv('DB_BATCH_SIZE', '500'))
+        self.logger = logging.getLogger(__name__)
+
+        queue_size = queue_size or int(os.getenv('PIPELINE_QUEUE_SIZE', '8'))
+        self._icon_queue = queue.Queue(maxsize=queue_size)
+        self._write_queue = queue.Queue(maxsize=queue_size)
+
+        # Писателей не больше, чем позволяет приемник (соединений в пуле БД)
+        db_workers = db_workers or int(os.getenv('DB_WRITERS', '2'))
+        if sink.max_writers:
+            db_workers = min(db_workers, sink.max_writers)
+        self._icon_threads = [
+            threading.Thread(target=self._icon_worker, name=f'pipeline-icons-{i}', daemon=True)
+            for i in range(icon_workers or int(os.getenv('PIPELINE_ICON_WORKERS', '2')))
+        ]
+        self._db_threads = [
+            threading.Thread(target=self._db_worker, name=f'pipeline-db-{i}', daemon=True)
+            for i in range(db_workers)
+        ]
+        for thread in self._icon_threads + self._db_threads:
+            thread.start()
+
+        metrics = get_metrics()
+        metrics.gauge('pipeline_icon_queue', self._icon_queue.qsize)
+        metrics.gauge('pipeline_write_queue', self._write_queue.qsize)
+        self._closed = False
+
+    def submit(self, rows, on_done=None):
+        """Отдать строки страницы в конвейер (блокируется, если запись отстает)"""
+        if self._closed:
+            raise RuntimeError("Конвейер уже остановлен")
+        # Иконки страницы начинают качаться сразу
+        self.icon_cache.prefetch(r['icon_url'] for r in rows)
+        self._icon_queue.put(PageJob(rows, on_done))
+
+    def attach_icon(self, data):
+        """Иконка строки из кэша иконок (скачивается один раз за обход)"""
+        icon = self.icon_cache.get(data['icon_url']) if data['icon_url'] else None
+        data['icon_hash'] = icon.hash if icon else None
+        data['icon_data'] = icon.data if icon else None
+        data['icon_content_type'] = icon.content_type if icon else None
+
+    def _icon_worker(self):
+        while True:
+            job = self._icon_queue.get()
+            try:
+                if job is _STOP:
+                    return
+                for data in job.rows:
+                    try:
+                        self.attach_icon(data)
+                    except Exception as e:
+                        self.logger.error(f"Ошибка при получении иконки {data['icon_url']}: {e}")
+                self._write_queue.put(job)
+            finally:
+                self._icon_queue.task_done()
+
+    def _db_worker(self):
+        while True:
+            jobs = []
+            taken = 0
+            stop = False
+            # Если запись отстает, склеиваем несколько страниц в одну транзакцию
+            while not stop and sum(len(job.rows) for job in jobs) < self.batch_size:
+                try:
+                    job = self._write_queue.get() if not taken else self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if job is _STOP:
+                    stop = True
+                else:
+                    jobs.append(job)
+
+            try:
+                rows = [data for job in jobs for data in job.rows]
+                failed = set()
+                for start in range(0, len(rows), self.batch_size):
+                    failed |= self.save(rows[start:start + self.batch_size])
+                for job in jobs:
+                    if job.on_done:
+                        try:
+                            # Страница с незаписанными адресами не считается записанной
+                            job_failed = {data['address'] for data in job.rows if data['address'] in failed}
+                            if job_failed:
+                                job.on_done(failed=job_failed)
+                            else:
+                                job.on_done()
+                        except Exception as e:
+                            self.logger.error(f"Ошибка в обработчике завершения страницы: {e}")
+            finally:
+                for _ in range(taken):
+                    self._write_queue.task_done()
+            if stop:
+                return
+
+    def save(self, batch):
+        """Запись пачки адресов; при ошибке пачки - построчно.
+
+        Возвращает множество адресов, которые записать не удалось.
+        """
+        failed = set()
+        if not batch:
+            return failed
+        try:
+            self.sink.write(batch)
+            self.registry.persist(batch)
+        except Exception as e:
+            self.logger.error(f"Ошибка пакетного сохранения ({len(batch)} адресов), сохраняем по одному: {e}")
+            for data in batch:
+                try:
+                    self.sink.write([data])
+                    self.registry.persist([data])
+                except Exception as e:
+                    self.logger.error(f"Ошибка сохранения адреса {data['address']}: {e}")
+                    self.registry.forget(data['address'])
+                    failed.add(data['address'])
+        return failed
+
+    def drain(self):
+        """Дождаться записи всего, что уже отдано в конвейер"""
+        self._icon_queue.join()
+        self._write_queue.join()
+
+    def close(self):
+        """Дописать очереди и остановить потоки"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._icon_threads:
+            self._icon_queue.put(_STOP)
+        for thread in self._icon_threads:
+            thread.join()
+        for _ in self._db_threads:
+            self._write_queue.put(_STOP)
+        for thread in self._db_threads:
+            thread.join()
+        self.sink.flush()
+        self.logger.info("Конвейер записи остановлен, очереди пусты")
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class AdaptiveRateLimiter:
+    """Общий token bucket для всех запросов к сайту.
+
+    Скорость снижается вдвое на 429/5xx и медленных ответах и плавно растет,
+    пока сайт отвечает быстро. Безопасен для потоков, есть async-вариант acquire.
+    """
+
+    def __init__(self, rate=None, min_rate=None, max_rate=None, slow_seconds=None):
+        self.rate = rate or float(os.getenv('RATE_LIMIT', '5'))
+        self.min_rate = min_rate or float(os.getenv('RATE_LIMIT_MIN', '0.5'))
+        self.max_rate = max_rate or float(os.getenv('RATE_LIMIT_MAX', '20'))
+        self.slow_seconds = slow_seconds or float(os.getenv('RATE_LIMIT_SLOW_SECONDS', '5'))
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._tokens = self.rate
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_backoff = 0.0
+        self._healthy = 0
+
+    def _reserve(self):
+        """Забронировать токен; возвращает, сколько секунд ждать"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record(self, status, latency, retry_after=None):
+        """Учесть ответ сайта: статус и время ответа в секундах"""
+        with self._lock:
+            now = time.monotonic()
+            if status == 429 or status >= 500 or latency > self.slow_seconds:
+                self._healthy = 0
+                if retry_after:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+                # Параллельные ответы одной волны снижают скорость один раз
+                if now - self._last_backoff >= 1.0:
+                    self._last_backoff = now
+                    self.rate = max(self.min_rate, self.rate / 2)
+                    self._tokens = min(self._tokens, 0.0)
+                    self.logger.warning(f"Сайт перегружен (HTTP {status}, {latency:.1f}s), скорость: {self.rate:.2f} запр/с")
+            elif status < 400:
+                # Примерно секунда здоровых ответов - прибавляем скорость
+                self._healthy += 1
+                if self._healthy >= self.rate and self.rate < self.max_rate:
+                    self._healthy = 0
+                    self.rate = min(self.max_rate, self.rate + 1)
+                    self.logger.debug(f"Скорость увеличена: {self.rate:.2f} запр/с")
+
+    def response_listener(self, base_url):
+        """Обработчик page.on('response') для запросов страницы к сайту"""
+        host = urlparse(base_url).hostname
+
+        def on_response(response):
+            request = response.request
+            if request.resource_type not in ('document', 'xhr', 'fetch'):
+                return
+            if urlparse(response.url).hostname != host:
+                return
+            timing = request.timing
+            latency = timing.get('responseStart', -1) / 1000 if timing else 0.0
+            retry_after = response.headers.get('retry-after')
+            self.record(
+                response.status,
+                max(latency, 0.0),
+                float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+
+        return on_response
@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import threading
+
+
+class AddressRegistry:
+    """Адреса, уже обработанные за текущий обход, с их наборами тегов.
+
+    Адрес, который снова встретился на странице другого тега с тем же набором
+    тегов, не требует ни иконки, ни записи в БД. Записанные адреса дописываются
+    в файл (data/$ADDRESS_REGISTRY_FILE), чтобы продолженный обход их помнил.
+    С persistent=False реестр живет только в памяти (режим очереди: data/
+    общий у реплик, а продолжение обхода хранится в самой очереди).
+    """
+
+    def __init__(self, data_dir='data', persistent=True):
+        filename = os.getenv('ADDRESS_REGISTRY_FILE', 'address_registry.jsonl')
+        self.path = os.path.join(data_dir, filename) if filename and persistent else None
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._tags = {}
+        self._file = None
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        address, tags = json.loads(line)
+                    except ValueError:
+                        # Недописанная строка после падения
+                        continue
+                    self._tags[address] = self._tags.get(address, frozenset()) | frozenset(tags)
+        except FileNotFoundError:
+            return
+        self.logger.info(f"Загружено адресов из реестра: {len(self._tags)}")
+
+    def __len__(self):
+        return len(self._tags)
+
+    def check(self, address, tags):
+        """Объединенный список тегов для записи или None, если с этими тегами адрес уже обработан"""
+        with self._lock:
+            known = self._tags.get(address)
+            if known is not None and known.issuperset(tags):
+                return None
+            merged = list(tags) + sorted(known - set(tags)) if known else list(tags)
+            self._tags[address] = frozenset(merged)
+            return merged
+
+    def filter_rows(self, rows, seen_in_tag):
+        """Строки страницы, которые нужно обработать; tags заменяются объединенным списком"""
+        selected = []
+        for data in rows:
+            address = data['address']
+            # Пропускаем дубликаты внутри тега
+            if address in seen_in_tag:
+                continue
+            seen_in_tag.add(address)
+
+            if data['tags'] is None:
+                self.logger.debug(f"Теги не найдены для адреса: {address}")
+                continue
+
+            # Адрес уже записан с этими тегами на странице другого тега
+            tags = self.check(address, data['tags'])
+            if tags is None:
+                self.logger.debug(f"Адрес {address[:8]}... уже обработан с теми же тегами")
+                continue
+            data['tags'] = tags
+            selected.append(data)
+        return selected
+
+    def forget(self, address):
+        """Адрес не удалось записать - пусть обработается снова"""
+        with self._lock:
+            self._tags.pop(address, None)
+
+    def persist(self, records):
+        """Дописать в файл реестра адреса, успешно записанные в БД"""
+        if not self.path or not records:
+            return
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            for data in records:
+                self._file.write(json.dumps([data['address'], data['tags']], ensure_ascii=False) + '\n')
+            self._file.flush()
+
+    def reset(self):
+        """Новый обход: забываем все адреса"""
+        with self._lock:
+            self._tags = {}
+            if self._file:
+                self._file.close()
+                self._file = None
+            if self.path:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
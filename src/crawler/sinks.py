@@ -0,0 +1,221 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from crawler.metrics import get_metrics
+
+
+def output_sinks():
+    """Куда писать результаты обхода: OUTPUT_SINKS=db, file или db,file"""
+    # Пустое значение (переменная без значения в .env) - по умолчанию db
+    names = {name.strip().lower() for name in (os.getenv('OUTPUT_SINKS') or 'db').split(',') if name.strip()}
+    unknown = names - {'db', 'file'}
+    if not names or unknown:
+        raise ValueError(f"Неизвестный OUTPUT_SINKS: {os.getenv('OUTPUT_SINKS')}")
+    return names
+
+
+def create_sink(names, address_repository=None):
+    """Приемник результатов по набору из output_sinks()"""
+    sinks = []
+    if 'db' in names:
+        sinks.append(DbSink(address_repository))
+    if 'file' in names:
+        sinks.append(NdjsonSink())
+    return sinks[0] if len(sinks) == 1 else MultiSink(sinks)
+
+
+class DbSink:
+    """Запись пачек адресов в БД через AddressRepository"""
+
+    def __init__(self, address_repository):
+        self.address_repository = address_repository
+        # Писателей не больше, чем соединений в пуле БД
+        self.max_writers = address_repository.db.maxconn
+        self.metrics = get_metrics()
+
+    def write(self, batch):
+        with self.metrics.timer('db'):
+            written = self.address_repository.save_addresses(batch)
+        # Неизмененные адреса (совпал отпечаток) в БД не пишутся
+        self.metrics.count('db_rows_written', written)
+        self.metrics.count('db_rows_unchanged', len(batch) - written)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class NdjsonSink:
+    """Потоковая выгрузка в NDJSON: одна строка на адрес, файл только дописывается.
+
+    Имя с суффиксом .gz включает gzip. Байты иконок в строку не попадают:
+    они лежат отдельными файлами icons_dir/hh/<sha256> (та же раскладка,
+    что у кэша иконок, поэтому по умолчанию это его же каталог).
+    """
+
+    max_writers = None
+
+    def __init__(self, path=None, icons_dir=None, append=True, fsync_seconds=None, buffer_size=None):
+        self.path = path or os.getenv('EXPORT_FILE', 'data/ethplorer_data.ndjson')
+        self.icons_dir = icons_dir or os.getenv('EXPORT_ICONS_DIR') or os.getenv('ICON_CACHE_DIR', 'data/icons')
+        self.fsync_seconds = fsync_seconds if fsync_seconds is not None else float(os.getenv('EXPORT_FSYNC_SECONDS', '5'))
+        buffer_size = buffer_size or int(os.getenv('EXPORT_BUFFER_SIZE', str(1 << 20)))
+        self.logger = logging.getLogger(__name__)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        mode = 'ab' if append else 'wb'
+        if self.path.endswith('.gz'):
+            # Дозапись в .gz добавляет новый gzip-member, gzip.open читает их подряд
+            self._file = gzip.open(self.path, mode)
+        else:
+            self._file = open(self.path, mode, buffering=buffer_size)
+        self._lock = threading.Lock()
+        self._synced = time.monotonic()
+        self.written = 0
+        self.metrics = get_metrics()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _icon_path(self, icon_hash):
+        return os.path.join(self.icons_dir, icon_hash[:2], icon_hash)
+
+    def _store_icon(self, data):
+        """Байты иконки в отдельный файл; возвращает хеш"""
+        icon_hash = data.get('icon_hash') or hashlib.sha256(data['icon_data']).hexdigest()
+        path = self._icon_path(icon_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data['icon_data'])
+            os.replace(tmp_path, path)
+        return icon_hash
+
+    def _record(self, data):
+        icon_hash = data.get('icon_hash')
+        if data.get('icon_data'):
+            icon_hash = self._store_icon(data)
+        record = {
+            'address': data['address'],
+            'name': data.get('name'),
+            'icon_url': data.get('icon_url'),
+            'icon_hash': icon_hash,
+            'icon_content_type': data.get('icon_content_type'),
+            'tags': data.get('tags', [])
+        }
+        if data.get('type'):
+            record['type'] = data['type']
+        return json.dumps(record, ensure_ascii=False) + '\n'
+
+    def write(self, batch):
+        with self.metrics.timer('file'):
+            lines = ''.join(self._record(data) for data in batch).encode('utf-8')
+            with self._lock:
+                self._file.write(lines)
+                self.written += len(batch)
+                # fsync не на каждую пачку, а раз в fsync_seconds
+                if time.monotonic() - self._synced >= self.fsync_seconds:
+                    self._sync()
+
+    def _sync(self):
+        """Вызывается под блокировкой"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._synced = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync()
+            self._file.close()
+        self.logger.info(f"Выгрузка {self.path}: записано строк {self.written}")
+
+
+class MultiSink:
+    """Одна пачка - в несколько приемников по очереди"""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+        limits = [sink.max_writers for sink in sinks if sink.max_writers]
+        self.max_writers = min(limits) if limits else None
+
+    def write(self, batch):
+        for sink in self.sinks:
+            sink.write(batch)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def read_ndjson(path, icons_dir=None, has_icon=None):
+    """Построчное чтение выгрузки; байты иконок подтягиваются из icons_dir.
+
+    has_icon(hash) - иконка уже есть у получателя, файл читать не нужно.
+    """
+    icons_dir = icons_dir or os.getenv('EXPORT_ICONS_DIR') or os.getenv('ICON_CACHE_DIR', 'data/icons')
+    logger = logging.getLogger(__name__)
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                # Недописанная строка после падения
+                logger.warning(f"{path}:{line_number}: пропущена поврежденная строка")
+                continue
+            data['icon_data'] = None
+            icon_hash = data.get('icon_hash')
+            if icon_hash and not (has_icon and has_icon(icon_hash)):
+                try:
+                    with open(os.path.join(icons_dir, icon_hash[:2], icon_hash), 'rb') as icon:
+                        data['icon_data'] = icon.read()
+                except FileNotFoundError:
+                    logger.warning(f"Нет файла иконки {icon_hash} для адреса {data['address']}")
+                    data['icon_hash'] = None
+            yield data
+
+
+def load_ndjson(path, address_repository, batch_size=None, icons_dir=None):
+    """Загрузка выгрузки в БД пачками: в памяти не больше одной пачки"""
+    logger = logging.getLogger(__name__)
+    batch_size = batch_size or int(os.getenv('DB_BATCH_SIZE', '500'))
+    loaded = 0
+    batch = []
+    for data in read_ndjson(path, icons_dir, has_icon=address_repository.has_icon):
+        batch.append(data)
+        if len(batch) >= batch_size:
+            address_repository.save_addresses(batch)
+            loaded += len(batch)
+            batch = []
+            logger.info(f"Загружено из {path}: {loaded}")
+    if batch:
+        address_repository.save_addresses(batch)
+        loaded += len(batch)
+    logger.info(f"Загрузка {path} завершена, адресов: {loaded}")
+    return loaded
@@ -0,0 +1,314 @@
+import logging
+import os
+import socket
+import threading
+
+from psycopg2.extras import execute_values
+
+# Ключ advisory-блокировки для заполнения очереди (одна реплика за раз)
+SEED_LOCK_KEY = 7_318_204
+
+
+class QueueItem:
+    """Взятый из очереди тег или диапазон страниц тега.
+
+    Реализует ту же часть интерфейса CrawlCheckpoint, что нужна обходу одного
+    тега (resume_page/page_done/tag_done), поэтому передается в TagProgress
+    и get_tag_data вместо файлового чекпоинта.
+    """
+
+    def __init__(self, queue, item_id, tag, first_page, last_page, next_page):
+        self.queue = queue
+        self.id = item_id
+        self.tag = tag
+        self.first_page = first_page
+        self.last_page = last_page
+        self.next_page = next_page
+        self.lost = False
+        self._lock = threading.Lock()
+        self._ahead = set()
+
+    def __repr__(self):
+        pages = f"{self.first_page}-{self.last_page or ''}" if self.first_page > 1 or self.last_page else 'все'
+        return f"{self.tag} (страницы {pages})"
+
+    def resume_page(self, tag):
+        return self.next_page
+
+    def page_done(self, tag, page):
+        """Страница записана; в очередь уходит последняя страница без пропусков"""
+        with self._lock:
+            if page < self.next_page:
+                return
+            self._ahead.add(page)
+            advanced = False
+            while self.next_page in self._ahead:
+                self._ahead.remove(self.next_page)
+                self.next_page += 1
+                advanced = True
+            next_page = self.next_page
+        if advanced:
+            self.queue.progress(self, next_page)
+
+    def tag_done(self, tag):
+        self.queue.complete(self)
+
+    def tag_failed(self, tag):
+        """Часть страниц не записана - задание вернется в очередь с next_page"""
+        self.release()
+
+    def release(self):
+        """Не удалось обработать - вернуть в очередь другим воркерам"""
+        self.queue.release(self)
+
+
+class TagWorkQueue:
+    """Очередь тегов в Postgres (таблица crawl_queue) для нескольких реплик парсера.
+
+    Теги забираются через SELECT ... FOR UPDATE SKIP LOCKED с арендой на
+    QUEUE_LEASE_SECONDS; фоновый поток продлевает аренду взятых тегов, а теги
+    упавших реплик по истечении аренды забирают другие (реплика без работы
+    ждет, пока в очереди остаются взятые задания). Номер следующей
+    страницы хранится в строке очереди, так что тег продолжается с места
+    остановки. Большие теги (по числу страниц прошлого обхода) можно делить
+    на диапазоны по QUEUE_PAGE_RANGE страниц.
+    """
+
+    def __init__(self, db, worker_id=None):
+        self.db = db
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = int(os.getenv('QUEUE_LEASE_SECONDS', '300'))
+        self.max_attempts = int(os.getenv('QUEUE_MAX_ATTEMPTS', '3'))
+        self.page_range = int(os.getenv('QUEUE_PAGE_RANGE', '0'))
+        self.recrawl_seconds = int(os.getenv('QUEUE_RECRAWL_SECONDS', '0'))
+        self.poll_seconds = int(os.getenv('QUEUE_POLL_SECONDS') or '30')
+        self.logger = logging.getLogger(__name__)
+
+        self._held = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def prepare(self):
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS crawl_queue (
+                        id SERIAL PRIMARY KEY,
+                        tag TEXT NOT NULL,
+                        first_page INTEGER NOT NULL DEFAULT 1,
+                        last_page INTEGER,
+                        next_page INTEGER NOT NULL DEFAULT 1,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        worker TEXT,
+                        lease_until TIMESTAMPTZ,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                        UNIQUE (tag, first_page)
+                    )
+                """)
+                # CREATE INDEX блокирует запись в таблицу даже для существующего индекса
+                cur.execute("SELECT to_regclass('crawl_queue_claim_idx')")
+                if cur.fetchone()[0] is None:
+                    cur.execute("""
+                        CREATE INDEX IF NOT EXISTS crawl_queue_claim_idx
+                        ON crawl_queue (status, lease_until)
+                    """)
+                conn.commit()
+
+    def seed(self, load_tags):
+        """Заполнить очередь новым обходом, если текущий закончен.
+
+        load_tags() вызывается только когда заполнять действительно нужно.
+        Возвращает число секунд до следующего обхода (0 - работа есть).
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                try:
+                    cur.execute("SELECT pg_advisory_xact_lock(%s)", (SEED_LOCK_KEY,))
+                    cur.execute("""
+                        SELECT
+                            count(*) FILTER (WHERE status IN ('pending', 'claimed')),
+                            count(*),
+                            EXTRACT(EPOCH FROM now() - max(updated_at))
+                        FROM crawl_queue
+                    """)
+                    active, total, idle = cur.fetchone()
+                    if active:
+                        conn.commit()
+                        return 0
+                    if total and idle is not None and idle < self.recrawl_seconds:
+                        conn.commit()
+                        return self.recrawl_seconds - float(idle)
+
+                    # Размеры тегов по прошлому обходу - для деления на диапазоны
+                    cur.execute("SELECT tag, max(next_page) - 1 FROM crawl_queue GROUP BY tag")
+                    known_pages = dict(cur.fetchall())
+
+                    tags = load_tags()
+                    rows = []
+                    for tag in tags:
+                        pages = known_pages.get(tag) or 0
+                        if self.page_range and pages > self.page_range:
+                            for first in range(1, pages + 1, self.page_range):
+                                last = first + self.page_range - 1
+                                # Последний диапазон открыт: тег мог вырасти
+                                rows.append((tag, first, last if last < pages else None, first))
+                        else:
+                            rows.append((tag, 1, None, 1))
+
+                    cur.execute("DELETE FROM crawl_queue")
+                    if rows:
+                        execute_values(cur, """
+                            INSERT INTO crawl_queue (tag, first_page, last_page, next_page)
+                            VALUES %s
+                            ON CONFLICT (tag, first_page) DO NOTHING
+                        """, rows, page_size=1000)
+                    conn.commit()
+                    self.logger.info(f"Очередь заполнена: тегов {len(tags)}, заданий {len(rows)}")
+                    return 0
+                except Exception:
+                    conn.rollback()
+                    raise
+
+    def claim(self):
+        """Взять следующий свободный (или брошенный упавшей репликой) тег; None - очередь пуста"""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                try:
+                    # Исчерпавшие попытки брошенные задания больше не раздаем
+                    cur.execute("""
+                        UPDATE crawl_queue
+                        SET status = 'failed', worker = NULL, lease_until = NULL, updated_at = now()
+                        WHERE status = 'claimed' AND lease_until < now() AND attempts >= %s
+                    """, (self.max_attempts,))
+                    cur.execute("""
+                        UPDATE crawl_queue
+                        SET status = 'claimed', worker = %s, attempts = attempts + 1,
+                            lease_until = now() + make_interval(secs => %s), updated_at = now()
+                        WHERE id = (
+                            SELECT id FROM crawl_queue
+                            WHERE status = 'pending'
+                               OR (status = 'claimed' AND lease_until < now())
+                            ORDER BY id
+                            FOR UPDATE SKIP LOCKED
+                            LIMIT 1
+                        )
+                        RETURNING id, tag, first_page, last_page, next_page, attempts
+                    """, (self.worker_id, self.lease_seconds))
+                    row = cur.fetchone()
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+        if row is None:
+            return None
+        item_id, tag, first_page, last_page, next_page, attempts = row
+        item = QueueItem(self, item_id, tag, first_page, last_page, next_page)
+        if attempts > 1:
+            self.logger.info(f"Забрано брошенное задание {item}, попытка {attempts}, со страницы {next_page}")
+        with self._lock:
+            self._held[item_id] = item
+        self._start_heartbeat()
+        return item
+
+    def unfinished(self):
+        """Заданий, еще не выполненных (в том числе взятых другими репликами).
+
+        Пока они есть, опустевшая для claim() очередь еще не закончена: задание
+        упавшей реплики вернется по истечении аренды, поэтому реплика ждет
+        QUEUE_POLL_SECONDS и пробует снова, а не завершается.
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*) FROM crawl_queue WHERE status IN ('pending', 'claimed')")
+                count = cur.fetchone()[0]
+                conn.commit()
+        return count
+
+    def _update(self, item, sql, params):
+        """Изменение своего задания; False - аренду уже забрала другая реплика"""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                try:
+                    cur.execute(sql + " WHERE id = %s AND worker = %s AND status = 'claimed'",
+                                params + (item.id, self.worker_id))
+                    updated = cur.rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        if not updated and not item.lost:
+            item.lost = True
+            self.logger.warning(f"Аренда задания {item} потеряна")
+        return bool(updated)
+
+    def progress(self, item, next_page):
+        self._update(item, """
+            UPDATE crawl_queue
+            SET next_page = %s, lease_until = now() + make_interval(secs => %s), updated_at = now()
+        """, (next_page, self.lease_seconds))
+
+    def complete(self, item):
+        with self._lock:
+            self._held.pop(item.id, None)
+        self._update(item, """
+            UPDATE crawl_queue
+            SET status = 'done', worker = NULL, lease_until = NULL, updated_at = now()
+        """, ())
+
+    def release(self, item):
+        with self._lock:
+            self._held.pop(item.id, None)
+        self._update(item, """
+            UPDATE crawl_queue
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                worker = NULL, lease_until = NULL, updated_at = now()
+        """, (self.max_attempts,))
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='queue-heartbeat', daemon=True)
+                self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        """Продление аренды всех взятых заданий (в том числе тех, что еще пишет конвейер)"""
+        while not self._stop.wait(max(self.lease_seconds / 3, 1)):
+            with self._lock:
+                held = dict(self._held)
+            if not held:
+                continue
+            try:
+                with self.db.get_connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("""
+                            UPDATE crawl_queue
+                            SET lease_until = now() + make_interval(secs => %s)
+                            WHERE id = ANY(%s) AND worker = %s AND status = 'claimed'
+                            RETURNING id
+                        """, (self.lease_seconds, list(held), self.worker_id))
+                        renewed = {row[0] for row in cur.fetchall()}
+                        conn.commit()
+            except Exception as e:
+                self.logger.error(f"Ошибка продления аренды: {e}")
+                continue
+            for item_id, item in held.items():
+                if item_id not in renewed:
+                    with self._lock:
+                        self._held.pop(item_id, None)
+                    if not item.lost:
+                        item.lost = True
+                        self.logger.warning(f"Аренда задания {item} потеряна")
+
+    def close(self):
+        """Остановить продление; невыполненные задания вернуть в очередь"""
+        self._stop.set()
+        with self._lock:
+            held = list(self._held.values())
+        for item in held:
+            try:
+                item.release()
+            except Exception as e:
+                self.logger.error(f"Ошибка возврата задания {item}: {e}")
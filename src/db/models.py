@@ -1,124 +1,355 @@
 from datetime import datetime
+import hashlib
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extras import execute_values
 from contextlib import contextmanager
 import logging
 import json
+import os
+import sys
+import threading
+
+# Колонки addresses, добавленные к исходной схеме
+ADDRESS_COLUMNS = (
+    ('icon_hash', 'TEXT REFERENCES icons (hash)'),
+    ('fingerprint', 'TEXT'),
+    ('enriched_at', 'TIMESTAMPTZ'),
+)
 
 class Database:
     def __init__(self, config):
-        self.pool = psycopg2.pool.SimpleConnectionPool(
+        # Пул потокобезопасный: соединения берут воркеры асинхронного обхода
+        self.maxconn = int(os.getenv('DB_POOL_MAX', '10'))
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
             minconn=1,
-            maxconn=10,
+            maxconn=self.maxconn,
             **config
         )
+        # getconn не ждет свободного соединения, а бросает PoolError, поэтому
+        # одновременных обращений к пулу не больше, чем в нем соединений
+        self._slots = threading.BoundedSemaphore(self.maxconn)
         
     @contextmanager
     def get_connection(self):
-        conn = self.pool.getconn()
-        try:
-            yield conn
-        finally:
-            self.pool.putconn(conn)
+        with self._slots:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+            finally:
+                self.pool.putconn(conn)
 
 class AddressRepository:
     def __init__(self, db):
         self.db = db
+        # Хеши иконок, уже лежащих в таблице icons
+        self._known_icons = set()
+        # Адрес -> (отпечаток, записанные теги): неизмененные строки не пишем
+        self._fingerprints = {}
+        # Тег -> (id, тип): таблица tags маленькая и почти не меняется
+        self._tags = {}
+
+    def prepare(self, tag_types=None):
+        """Подготовка к обходу: недостающие таблицы/колонки и прогрев кэшей.
+
+        tag_types - типы тегов из tags.csv (read_tags_csv): недостающие теги
+        создаются сразу с типом, а у известных тип 'other' уточняется.
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                # Иконки хранятся один раз по хешу содержимого, адреса ссылаются на них
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS icons (
+                        hash TEXT PRIMARY KEY,
+                        data BYTEA NOT NULL,
+                        content_type TEXT,
+                        size INTEGER NOT NULL,
+                        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    )
+                """)
+                # ALTER TABLE берет ACCESS EXCLUSIVE даже с IF NOT EXISTS и остановил бы
+                # запись других реплик, поэтому выполняется только для недостающих колонок
+                cur.execute("""
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = 'addresses'
+                """)
+                columns = {row[0] for row in cur.fetchall()}
+                for column, definition in ADDRESS_COLUMNS:
+                    if column not in columns:
+                        cur.execute(f"ALTER TABLE addresses ADD COLUMN IF NOT EXISTS {column} {definition}")
+                cur.execute("SELECT hash FROM icons")
+                self._known_icons = {row[0] for row in cur.fetchall()}
+
+                typed = [(tag, tag_type) for tag, tag_type in (tag_types or {}).items() if tag_type]
+                if typed:
+                    execute_values(cur, """
+                        INSERT INTO tags (tag, type)
+                        VALUES %s
+                        ON CONFLICT (tag) DO UPDATE SET type = EXCLUDED.type
+                        WHERE tags.type IS NULL OR tags.type = 'other'
+                    """, typed, page_size=1000)
+                cur.execute("SELECT tag, id, type FROM tags")
+                self._tags = {tag: (tag_id, tag_type) for tag, tag_id, tag_type in cur.fetchall()}
+                conn.commit()
+
+            # Отпечатки читаем потоком (серверный курсор), таблица может быть большой
+            with conn.cursor(name='address_fingerprints') as cur:
+                cur.itersize = 10000
+                cur.execute("""
+                    SELECT a.address, a.fingerprint, array_remove(array_agg(t.tag ORDER BY at.tag_id), NULL)
+                    FROM addresses a
+                    LEFT JOIN address_tags at ON at.address_id = a.id
+                    LEFT JOIN tags t ON t.id = at.tag_id
+                    WHERE a.fingerprint IS NOT NULL
+                    GROUP BY a.id
+                """)
+                self._fingerprints = {
+                    address: (fingerprint, tuple(sys.intern(tag) for tag in tags))
+                    for address, fingerprint, tags in cur
+                }
+            conn.commit()
+        logging.info(
+            f"Загружено хешей иконок: {len(self._known_icons)}, тегов: {len(self._tags)}, "
+            f"отпечатков адресов: {len(self._fingerprints)}"
+        )
+
+    @staticmethod
+    def fingerprint(address_data):
+        """Отпечаток того, что хранится по адресу: имя, иконка, URL иконки и теги"""
+        content = json.dumps([
+            address_data.get('name'),
+            address_data.get('icon_hash'),
+            address_data.get('icon_url'),
+            sorted(address_data.get('tags', []))
+        ], ensure_ascii=False)
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _remember(self, written):
+        """Запомнить отпечатки после коммита (и строк, уже совпавших в БД)"""
+        for address_data, fingerprint in written:
+            self._fingerprints[address_data['address']] = (
+                fingerprint, tuple(sys.intern(tag) for tag in address_data.get('tags', []))
+            )
+
+    @staticmethod
+    def _address_type(tags, tags_info):
+        """Тип адреса - первый тип его тегов, отличный от 'other' (если такого нет - 'other')"""
+        types = [tags_info[tag][1] for tag in tags if tags_info[tag][1]]
+        for tag_type in types:
+            if tag_type != 'other':
+                return tag_type
+        return types[0] if types else ""
+
+    def has_icon(self, icon_hash):
+        """Иконка с таким хешем уже есть в таблице icons"""
+        return icon_hash in self._known_icons
+
+    def addresses_to_enrich(self, max_age_seconds=0, limit=0):
+        """Адреса для дообогащения со страницы адреса.
+
+        Без имени или иконки и еще не обогащавшиеся; при max_age_seconds -
+        также все, обогащенные раньше этого срока. Сначала те, что не
+        обогащались никогда.
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT address, name, icon_url
+                    FROM addresses
+                    WHERE (enriched_at IS NULL AND (name IS NULL OR name = '' OR icon_hash IS NULL))
+                       OR (%(max_age)s > 0 AND (enriched_at IS NULL
+                           OR enriched_at < now() - make_interval(secs => %(max_age)s)))
+                    ORDER BY enriched_at NULLS FIRST, id
+                    {'LIMIT %(limit)s' if limit else ''}
+                """, {'max_age': max_age_seconds, 'limit': limit})
+                rows = cur.fetchall()
+                conn.commit()
+        return [{'address': address, 'name': name, 'icon_url': icon_url} for address, name, icon_url in rows]
+
+    def mark_enriched(self, addresses):
+        """Отметить адреса обогащенными (в том числе те, что не изменились)"""
+        if not addresses:
+            return
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                try:
+                    cur.execute(
+                        "UPDATE addresses SET enriched_at = now() WHERE address = ANY(%s)",
+                        (list(addresses),)
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
 
     def save_address(self, address_data):
+        """Сохранение одного адреса (пачка из одной записи)"""
+        return self.save_addresses([address_data])
+
+    def save_addresses(self, batch):
+        """Сохранение пачки адресов одной транзакцией многострочными upsert-ами.
+
+        Адреса, чей отпечаток совпадает с записанным, пропускаются без
+        обращения к БД. Связи с тегами только добавляются, поэтому отпечаток
+        считается по объединению новых тегов с уже записанными: адрес из
+        нескольких тегов не переписывается на каждой странице, где встретился.
+        Возвращает число действительно записанных адресов.
+        """
+        # ON CONFLICT DO UPDATE не может обновить одну строку дважды за запрос,
+        # поэтому повторы адреса внутри пачки склеиваем, объединяя теги
+        rows = {}
+        for address_data in batch:
+            previous = rows.get(address_data['address'])
+            if previous:
+                tags = list(previous.get('tags', []))
+                tags += [t for t in address_data.get('tags', []) if t not in tags]
+                address_data = {**address_data, 'tags': tags}
+            rows[address_data['address']] = address_data
+        fingerprints = {}
+        for address, address_data in rows.items():
+            known_fingerprint, known_tags = self._fingerprints.get(address, (None, ()))
+            if known_tags:
+                tags = list(known_tags) + [t for t in address_data.get('tags', []) if t not in known_tags]
+                address_data = rows[address] = {**address_data, 'tags': tags}
+            fingerprint = self.fingerprint(address_data)
+            if fingerprint != known_fingerprint:
+                fingerprints[address] = fingerprint
+        if len(fingerprints) < len(rows):
+            logging.debug(f"Без изменений: {len(rows) - len(fingerprints)} из {len(rows)}")
+        # Строки блокируются в порядке VALUES: единый порядок (по адресу, тегу, хешу)
+        # у всех писателей исключает взаимную блокировку на общих адресах и тегах
+        rows = [rows[address] for address in sorted(fingerprints)]
+        if not rows:
+            return 0
+
         with self.db.get_connection() as conn:
             with conn.cursor() as cur:
                 try:
-                    # Создаем копию данных для логов без icon_data
-                    loggable_data = {k: v for k, v in address_data.items() if k != 'icon_data'}
-                    
-                    # Логирование перед сохранением
-                    logging.debug(f"Сохранение адреса: {address_data['address']}")
-                    logging.debug(f"Данные для сохранения: {json.dumps(loggable_data, default=str, indent=2)}")
-                    
-                    # Сохраняем адрес в основную таблицу
-                    cur.execute("""
-                        INSERT INTO addresses (address, name, icon, icon_url)
-                        VALUES (%s, %s, %s::bytea, %s)
+                    logging.debug(f"Сохранение пачки адресов: {len(rows)}")
+                    for address_data in rows:
+                        # Создаем копию данных для логов без icon_data
+                        loggable_data = {k: v for k, v in address_data.items() if k != 'icon_data'}
+                        logging.debug(f"Данные для сохранения: {json.dumps(loggable_data, default=str)}")
+
+                    # Новые иконки пишем один раз по хешу
+                    new_icons = {}
+                    for address_data in rows:
+                        icon_hash = address_data.get('icon_hash')
+                        if icon_hash and icon_hash not in self._known_icons and address_data.get('icon_data'):
+                            new_icons[icon_hash] = (
+                                icon_hash,
+                                address_data['icon_data'],
+                                address_data.get('icon_content_type'),
+                                len(address_data['icon_data'])
+                            )
+                    if new_icons:
+                        execute_values(cur, """
+                            INSERT INTO icons (hash, data, content_type, size)
+                            VALUES %s
+                            ON CONFLICT (hash) DO NOTHING
+                        """, [new_icons[icon_hash] for icon_hash in sorted(new_icons)],
+                            template="(%s, %s::bytea, %s, %s)",
+                            page_size=len(new_icons))
+
+                    # Сохраняем адреса в основную таблицу (icon - ссылка на icons.hash).
+                    # Строка с тем же отпечатком (записана другой репликой) не
+                    # обновляется и не возвращается - дальше она не нужна
+                    result = execute_values(cur, """
+                        INSERT INTO addresses (address, name, icon_hash, icon_url, fingerprint)
+                        VALUES %s
                         ON CONFLICT (address) 
                         DO UPDATE SET 
                             name = EXCLUDED.name,
-                            icon = EXCLUDED.icon::bytea,
-                            icon_url = EXCLUDED.icon_url
-                        RETURNING id
-                    """, (
-                        address_data['address'],
-                        address_data['name'],
-                        address_data.get('icon_data'),
-                        address_data.get('icon_url')
-                    ))
-                    address_id = cur.fetchone()[0]
-                    logging.debug(f"Saved to addresses table, got id: {address_id}")
-                    
-                    # Сохраняем в unified_addresses
-                    tags = address_data.get('tags', [])
-                    address_name = address_data['name'] if address_data['name'] else (tags[0] if tags else '')
-                    
-                    logging.debug(f"Preparing unified_addresses data: address={address_data['address']}, name={address_name}")
-                    
-                    # Получаем тип из тегов
-                    tag_type = None
-                    if tags:
-                        cur.execute("""
-                            SELECT t.type 
-                            FROM tags t
-                            JOIN address_tags at ON t.id = at.tag_id
-                            JOIN addresses a ON at.address_id = a.id
-                            WHERE a.address = %s
-                            LIMIT 1
-                        """, (address_data['address'],))
-                        result = cur.fetchone()
-                        tag_type = result[0] if result else None
-                    
-                    cur.execute("""
+                            icon_hash = EXCLUDED.icon_hash,
+                            icon_url = EXCLUDED.icon_url,
+                            fingerprint = EXCLUDED.fingerprint
+                        WHERE addresses.fingerprint IS DISTINCT FROM EXCLUDED.fingerprint
+                        RETURNING id, address
+                    """, [
+                        (
+                            address_data['address'],
+                            address_data['name'],
+                            address_data.get('icon_hash'),
+                            address_data.get('icon_url'),
+                            fingerprints[address_data['address']]
+                        )
+                        for address_data in rows
+                    ], page_size=len(rows), fetch=True)
+                    address_ids = {address: address_id for address_id, address in result}
+                    logging.debug(f"Saved to addresses table, got {len(address_ids)} ids")
+                    written = [(address_data, fingerprints[address_data['address']]) for address_data in rows]
+                    rows = [address_data for address_data in rows if address_data['address'] in address_ids]
+                    if not rows:
+                        conn.commit()
+                        self._known_icons.update(new_icons)
+                        self._remember(written)
+                        return 0
+
+                    # Недостающие теги создаем один раз; id остальных - из кэша
+                    new_tags = {}
+                    for address_data in rows:
+                        for tag in address_data.get('tags', []):
+                            if tag not in self._tags and new_tags.get(tag) is None:
+                                new_tags[tag] = address_data.get('type')
+                    created_tags = {}
+                    if new_tags:
+                        # DO UPDATE, а не DO NOTHING: id нужен и для тега, созданного другим писателем
+                        result = execute_values(cur, """
+                            INSERT INTO tags (tag, type)
+                            VALUES %s
+                            ON CONFLICT (tag) DO UPDATE SET 
+                                tag = EXCLUDED.tag
+                            RETURNING tag, id, type
+                        """, sorted(new_tags.items()), template="(%s, COALESCE(%s, 'other'))",
+                            page_size=len(new_tags), fetch=True)
+                        created_tags = {tag: (tag_id, tag_type) for tag, tag_id, tag_type in result}
+                    tags_info = {**self._tags, **created_tags}
+
+                    # Сохраняем в unified_addresses; тип - по тегам адреса
+                    unified_rows = []
+                    for address_data in rows:
+                        tags = address_data.get('tags', [])
+                        address_name = address_data['name'] if address_data['name'] else (tags[0] if tags else '')
+                        unified_rows.append((
+                            address_data['address'],
+                            address_name,
+                            self._address_type(tags, tags_info),
+                            "ethplorer.io tag"
+                        ))
+                    execute_values(cur, """
                         INSERT INTO unified_addresses (address, address_name, type, source)
-                        VALUES (%s, %s, %s, %s)
+                        VALUES %s
                         ON CONFLICT (address) 
                         DO UPDATE SET 
                             address_name = EXCLUDED.address_name,
                             type = COALESCE(EXCLUDED.type, unified_addresses.type),
                             source = EXCLUDED.source
-                        RETURNING id
-                    """, (
-                        address_data['address'],
-                        address_name,
-                        tag_type or "",  # Используем тип из тега или пустую строку
-                        "ethplorer.io tag"
-                    ))
-                    unified_id = cur.fetchone()[0]
-                    logging.debug(f"Saved to unified_addresses, got id: {unified_id}")
-                    
-                    # Сохраняем теги
-                    if 'tags' in address_data:
-                        for tag in address_data['tags']:
-                            # Добавляем тег если его нет
-                            cur.execute("""
-                                INSERT INTO tags (tag, type)
-                                VALUES (%s, COALESCE(%s, 'other'))
-                                ON CONFLICT (tag) DO UPDATE SET 
-                                    tag = EXCLUDED.tag
-                                RETURNING id
-                            """, (tag, address_data.get('type')))
-                            tag_id = cur.fetchone()[0]
-                            # Связываем адрес с тегом
-                            cur.execute("""
-                                INSERT INTO address_tags (address_id, tag_id)
-                                VALUES (%s, %s)
-                                ON CONFLICT (address_id, tag_id) DO NOTHING
-                            """, (address_id, tag_id))
-                    
+                    """, unified_rows, page_size=len(unified_rows))
+                    logging.debug(f"Saved to unified_addresses: {len(unified_rows)}")
+
+                    # Связываем адреса с тегами
+                    links = {
+                        (address_ids[address_data['address']], tags_info[tag][0])
+                        for address_data in rows
+                        for tag in address_data.get('tags', [])
+                    }
+                    if links:
+                        execute_values(cur, """
+                            INSERT INTO address_tags (address_id, tag_id)
+                            VALUES %s
+                            ON CONFLICT (address_id, tag_id) DO NOTHING
+                        """, sorted(links), page_size=len(links))
+
                     conn.commit()
-                    logging.debug(f"Successfully saved address {address_data['address']} to all tables")
-                    
-                    # Логирование после сохранения
-                    logging.debug(f"Успешно сохранено {len(address_data.get('tags', []))} тегов для адреса {address_data['address']}")
-                    
+                    self._known_icons.update(new_icons)
+                    # Кэш тегов пополняем только после коммита: id из откаченной
+                    # транзакции не существуют
+                    self._tags.update(created_tags)
+                    self._remember(written)
+                    logging.debug(f"Successfully saved {len(rows)} addresses to all tables")
+                    return len(rows)
+
                 except Exception as e:
                     conn.rollback()
-                    logging.error(f"Error saving address to database: {str(e)}")
-                    raise 
\ No newline at end of file
+                    logging.error(f"Error saving addresses to database: {str(e)}")
+                    raise
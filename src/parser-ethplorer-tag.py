@@ -1,55 +1,93 @@
-from playwright.sync_api import sync_playwright
-import time
+from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 import json
 import logging
-from pathlib import Path
 import os
-import aiohttp
-import base64
-from datetime import datetime
+import time
 from db.models import Database, AddressRepository
+from crawler.config import setup_logging, db_config_from_env, read_tags_csv
+from crawler.extract import ROWS_SCRIPT, PAGE_SIGNATURE_SCRIPT, PAGE_CHANGED_SCRIPT, parse_rows
+from crawler.icons import IconCache
+from crawler.checkpoint import CrawlCheckpoint
+from crawler.rate_limit import AdaptiveRateLimiter
+from crawler.registry import AddressRegistry
+from crawler.pipeline import Pipeline, TagProgress
+from crawler.sinks import NdjsonSink, create_sink, load_ndjson, output_sinks
+from crawler.metrics import profile_tag, setup_metrics
+from crawler.work_queue import TagWorkQueue
+from crawler.browser import LeanBrowser
 
 class EthplorerParser:
     def __init__(self):
         self.base_url = os.getenv('BASE_URL', 'https://ethplorer.io')
+        # Настройка логирования и метрик (METRICS_ENABLED)
+        setup_logging()
+        self.logger = logging.getLogger(__name__)
+        self.metrics = setup_metrics()
+
+        # Общий ограничитель скорости: подстраивается под ответы сайта
+        self.rate_limiter = AdaptiveRateLimiter()
+        self.page_ready_timeout = int(os.getenv('PAGE_READY_TIMEOUT', '30000'))
+
+        self.lean_browser = LeanBrowser()
         self.playwright = sync_playwright().start()
         self.browser = self.playwright.chromium.launch(
-            headless=os.getenv('PLAYWRIGHT_HEADLESS', 'true').lower() == 'true'
-        )
-        self.context = self.browser.new_context()
-        self.page = self.context.new_page()
-        
-        # Настройка логирования
-        logging.basicConfig(
-            level=getattr(logging, os.getenv('PARSER_LOG_LEVEL', 'INFO')),
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(f"data/{os.getenv('LOG_FILE', 'parser.log')}"),
-                logging.StreamHandler()
-            ]
+            **self.lean_browser.launch_options(os.getenv('PLAYWRIGHT_HEADLESS', 'true').lower() == 'true')
         )
-        self.logger = logging.getLogger(__name__)
+        self.open_page()
+
+        self.metrics.gauge('rate_limit', lambda: self.rate_limiter.rate)
 
-        # Инициализация базы данных
-        db_config = {
-            'dbname': os.getenv('DB_NAME'),
-            'user': os.getenv('DB_USER'),
-            'password': os.getenv('DB_PASSWORD'),
-            'host': os.getenv('DB_HOST'),
-            'port': os.getenv('DB_PORT')
-        }
-        self.logger.info(f"Подключение к БД: {db_config}")
-        self.db = Database(db_config)
-        self.address_repository = AddressRepository(self.db)
+        # Инициализация базы данных (не нужна, если пишем только в файл)
+        outputs = output_sinks()
+        self.db = None
+        self.address_repository = None
+        if 'db' in outputs:
+            db_config = db_config_from_env()
+            self.logger.info(f"Подключение к БД: {db_config}")
+            self.db = Database(db_config)
+            self.address_repository = AddressRepository(self.db)
+            self.address_repository.prepare(read_tags_csv())
+        self.sink = create_sink(outputs, self.address_repository)
+        self.icon_cache = IconCache(rate_limiter=self.rate_limiter)
+        self.checkpoint = CrawlCheckpoint()
+        queue_mode = os.getenv('CRAWL_MODE', 'tags').lower() == 'queue'
+        self.registry = AddressRegistry(persistent=not queue_mode)
+        self.pipeline = Pipeline(self.sink, self.icon_cache, self.registry)
+        self.work_queue = None
         
 
 
+    def open_page(self):
+        """Новый контекст и страница браузера (облегченный режим - BROWSER_LEAN)"""
+        self.context = self.browser.new_context(**self.lean_browser.context_options())
+        self.page = self.context.new_page()
+        self.page.on("response", self.rate_limiter.response_listener(self.base_url))
+        self.page_tracker = self.lean_browser.setup_sync(self.context, self.page)
+
+    def recycle_page(self):
+        """Пересоздать страницу между тегами, если она отработала свое"""
+        if not self.page_tracker.expired:
+            return
+        self.logger.info(f"Страница браузера пересоздается: {self.page_tracker.describe()}")
+        self.context.close()
+        self.open_page()
+
+    def wait_first_page(self):
+        """Ожидание строк с адресами (а не заглушек); False - адресов в таблице нет"""
+        try:
+            self.page.wait_for_function(PAGE_CHANGED_SCRIPT, arg='', timeout=self.page_ready_timeout)
+            return True
+        except PlaywrightTimeoutError:
+            return False
+
     def get_tags(self):
         """Получение списка всех тегов с сайта"""
         tags = []
         try:
             self.logger.info("Начинаем получение списка тегов с сайта")
+            self.rate_limiter.acquire()
             self.page.goto(f"{self.base_url}/tag")
+            self.page_tracker.navigated()
             self.page.wait_for_selector('.word-cloud-item a')
             
             tag_elements = self.page.query_selector_all('.word-cloud-item a')
@@ -65,130 +103,57 @@ class EthplorerParser:
             self.logger.error(f"Ошибка при получении тегов: {e}")
             return []
 
-    def get_tag_data(self, tag):
-        """Получение данных по конкретному тегу"""
+    def get_tag_data(self, tag, checkpoint=None, last_page=None):
+        """Получение данных по конкретному тегу (в режиме очереди - до last_page)"""
+        checkpoint = checkpoint or self.checkpoint
         processed_addresses = set()
         tag_counter = 0
         current_page = 1
+        # Тег готов, когда конвейер запишет все его страницы
+        progress = TagProgress(tag, checkpoint)
+        completed = False
 
         try:
             self.logger.info(f"Начинаем обработку тега: {tag}")
-            self.page.goto(f"{self.base_url}/tag/{tag}")
-            self.page.wait_for_selector('tbody tr', timeout=10000)  # Ждем загрузки таблицы
+            self.recycle_page()
+            self.rate_limiter.acquire()
+            with self.metrics.timer('navigation'):
+                self.page.goto(f"{self.base_url}/tag/{tag}")
+                self.page_tracker.navigated()
+                ready = self.wait_first_page()
+            if not ready:
+                # Пустой или удаленный тег - не ошибка, иначе он навсегда остался бы в чекпоинте
+                self.logger.warning(f"В таблице тега {tag} нет адресов, тег считается пустым")
+                completed = True
+                return completed
             
+            start_page = checkpoint.resume_page(tag)
+            if start_page > 1:
+                self.logger.info(f"Продолжаем тег {tag} со страницы {start_page}")
+            
+            completed = True
             while True:
-                # Ожидаем обновления данных после пагинации
-                self.page.wait_for_load_state("networkidle")
-                time.sleep(1)
-
-                # Получаем все блоки адресов
-                address_blocks = self.page.query_selector_all('tbody tr')
+                # Страницы до сохраненной в чекпоинте только пролистываем
+                if current_page >= start_page:
+                    # Все строки страницы одним вызовом evaluate
+                    with self.metrics.timer('extract'):
+                        rows = parse_rows(self.page.evaluate(ROWS_SCRIPT), self.base_url)
+                    self.metrics.count('pages')
+                    self.metrics.count('rows', len(rows))
+                    # Только адреса, которых еще не было в обходе с такими тегами
+                    rows = self.registry.filter_rows(rows, processed_addresses)
                 
-                for block in address_blocks:
-                    try:
-                        # Получаем адрес
-                        address_element = block.query_selector('.tags-table-address .overflow-center-elips')
-                        address = address_element.inner_text().strip() if address_element else ''
-                        
-                        # Пропускаем дубликаты
-                        if not address or address in processed_addresses:
-                            continue
-                        
-                        processed_addresses.add(address)
-                        
-                        # Получаем контейнер тегов
-                        tags_container = block.query_selector('span.tags-list')
-                        if not tags_container:
-                            self.logger.debug(f"Теги не найдены для адреса: {address}")
-                            continue
-                        
-                        # Собираем все теги (включая иконки)
-                        tag_elements = tags_container.query_selector_all('.tag__public')
-                        address_tags = []
-                        
-                        for t in tag_elements:
-                            try:
-                                tag_text = None  # Инициализируем переменную
-                                href = None      # Добавляем инициализацию href
-                                
-                                # Вариант 1: Текстовый тег
-                                text_element = t.query_selector('.tag_name')
-                                if text_element:
-                                    tag_text = text_element.inner_text().strip()
-                                
-                                # Вариант 2: data-tag атрибут
-                                if not tag_text:
-                                    tag_text = t.get_attribute('data-tag') or ''
-                                    tag_text = tag_text.strip()
-                                
-                                # Вариант 3: Извлечение из URL
-                                if not tag_text:
-                                    href = t.get_attribute('href')  # Теперь href определен
-                                    if href and '/tag/' in href:
-                                        tag_text = href.split('/tag/')[-1].split('?')[0].strip()
-                                
-                                if tag_text:
-                                    address_tags.append(tag_text)
-                                    tag_counter += 1
-                                    self.logger.debug(
-                                        f"Тэг найден: {tag_text} | Источник: "
-                                        f"text={bool(text_element)}, "
-                                        f"data-tag={bool(t.get_attribute('data-tag'))}, "
-                                        f"href={bool(href)}"
-                                    )
-                                    
-                            except Exception as e:
-                                self.logger.error(f"Ошибка обработки тега: {str(e)}")
-                                continue
-                        
-                        # Логируем результат
-                        self.logger.debug(f"Адрес: {address[:8]}... | Теги: {len(address_tags)}")
-                        
-                        # Получаем имя токена/контракта
-                        name_element = block.query_selector('.tags-table-token a')
-                        name = name_element.inner_text().strip() if name_element else ''
-                        
-                        # Получаем иконку
-                        icon_data = None
-                        icon_url = None
-                        icon_element = block.query_selector('.tags-table-token-icon')
-                        if icon_element:
-                            icon_url = icon_element.get_attribute('src')
-                            if icon_url:
-                                if icon_url.startswith('/'):
-                                    icon_url = f"{self.base_url}{icon_url}"
-                                try:
-                                    response = self.context.request.get(icon_url)
-                                    if response.ok:
-                                        icon_data = response.body()
-                                        # Проверяем размер данных (например, до 1MB)
-                                        if len(icon_data) > 1_000_000:
-                                            self.logger.warning(f"Иконка слишком большая: {len(icon_data)} bytes")
-                                            icon_data = None
-                                except Exception as e:
-                                    self.logger.error(f"Ошибка при получении иконки {icon_url}: {e}")
-                        
-                        # Сохраняем данные в базу
-                        data = {
-                            'address': address,
-                            'name': name,
-                            'icon_url': icon_url,
-                            'icon_data': icon_data,
-                            'tags': address_tags
-                        }
-                        
-                        # Логируем без icon_data
-                        self.logger.info(f"Сохранен адрес: {address[:20]}... с тегами: {', '.join(address_tags)}")
-                        self.logger.debug(f"Данные адреса (без icon_data): {json.dumps({k:v for k,v in data.items() if k != 'icon_data'}, default=str)}")
-                        
-                        self.address_repository.save_address(data)
-                        
-                        # После сбора тегов для адреса:
-                        tag_counter += len(address_tags)
-                    
-                    except Exception as e:
-                        self.logger.error(f"Ошибка обработки блока: {e}")
-                        continue
+                    for data in rows:
+                        tag_counter += len(data['tags'])
+                        self.logger.info(f"Сохранен адрес: {data['address'][:20]}... с тегами: {', '.join(data['tags'])}")
+                        self.logger.debug(f"Данные адреса: {json.dumps(data, default=str)}")
+
+                    # Иконки и запись в БД - в фоновых потоках конвейера
+                    self.pipeline.submit(rows, on_done=progress.page_submitted(current_page))
+
+                if last_page and current_page >= last_page:
+                    self.logger.info("Достигнут конец диапазона страниц")
+                    break
 
                 # Обработка пагинации
                 next_button = self.page.query_selector(
@@ -200,13 +165,18 @@ class EthplorerParser:
                     break
                     
                 try:
-                    next_button.click()
-                    current_page += 1
-                    self.logger.info(f"Переход на страницу {current_page}")
-                    self.page.wait_for_load_state("networkidle")
-                    time.sleep(1)  # Даем время на загрузку
+                    # Ждем, пока таблица действительно сменится, а не фиксированную паузу
+                    previous = self.page.evaluate(PAGE_SIGNATURE_SCRIPT)
+                    self.rate_limiter.acquire()
+                    with self.metrics.timer('navigation'):
+                        next_button.click()
+                        current_page += 1
+                        self.page_tracker.navigated()
+                        self.logger.info(f"Переход на страницу {current_page}")
+                        self.page.wait_for_function(PAGE_CHANGED_SCRIPT, arg=previous, timeout=self.page_ready_timeout)
                 except Exception as e:
                     self.logger.error(f"Ошибка пагинации: {e}")
+                    completed = False
                     break
 
             # Финализируем логирование
@@ -214,92 +184,55 @@ class EthplorerParser:
             self.logger.info(f"Всего уникальных адресов: {len(processed_addresses)}")
             self.logger.info(f"Всего тегов сохранено: {tag_counter}")
             self.logger.info(f"Среднее тегов на адрес: {tag_counter/len(processed_addresses) if processed_addresses else 0:.2f}")
+            self.logger.info(f"Трафик браузера: {self.page_tracker.describe()}")
         
         except Exception as e:
             self.logger.error(f"Критическая ошибка: {e}")
+            completed = False
+        finally:
+            progress.close(completed)
+        return completed
 
-    def append_to_json(self, data, filename='data/ethplorer_data.json'):
-        """Добавление новых данных в JSON файл"""
+    def append_to_json(self, data, filename=None):
+        """Дозапись данных в NDJSON-выгрузку (файл не перечитывается)"""
         try:
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                existing_data = []
-            
-            existing_data.extend(data)
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, ensure_ascii=False, indent=4)
-            
-            self.logger.info(f"Данные успешно сохранены в {filename}")
-                
+            with NdjsonSink(filename) as sink:
+                sink.write(data)
+            self.logger.info(f"Данные успешно сохранены в {sink.path}")
         except Exception as e:
             self.logger.error(f"Ошибка при сохранении данных: {e}")
 
-    def save_to_json(self, data, filename='data/ethplorer_data.json'):
-        """Сохранение данных в JSON для последующей записи в SQL"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+    def save_to_json(self, data, filename=None):
+        """Сохранение данных в NDJSON для последующей загрузки в SQL (load_ndjson)"""
+        with NdjsonSink(filename, append=False) as sink:
+            sink.write(data)
             
     def close(self):
         """Закрытие браузера и playwright"""
+        # Сначала дописываем все, что уже собрано
+        self.pipeline.close()
+        self.sink.close()
+        if self.work_queue:
+            # Незавершенные задания сразу возвращаются в очередь
+            self.work_queue.close()
+        self.icon_cache.close()
+        self.registry.close()
+        self.metrics.close()
         self.context.close()
         self.browser.close()
         self.playwright.stop()
 
-    async def process_address(self, address):
-        try:
-            await self.page.goto(f"{self.base_url}/address/{address}")
-            await self.page.wait_for_load_state('networkidle')
-            
-            # Получаем иконку
-            icon_data = None
-            icon_url = None
-            icon_element = await self.page.query_selector('.tags-table-token-icon')
-            if icon_element:
-                icon_url = await icon_element.get_attribute('src')
-                if icon_url:
-                    if icon_url.startswith('/'):
-                        icon_url = f"{self.base_url}{icon_url}"
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(icon_url) as response:
-                            if response.status == 200:
-                                icon_data = await response.read()  # Теперь сохраняем как bytes
-
-            # Получаем название и описание
-            name = await self.get_text_content('.address-name-text')
-            
-            # Получаем теги
-            tags = []
-            tag_elements = await self.page.query_selector_all('.tag-item')
-            for tag_element in tag_elements:
-                tag_text = await tag_element.text_content()
-                tags.append(tag_text.strip())
-
-            data = {
-                'address': address,
-                'name': name,
-                'icon_url': icon_url,
-                'icon_data': icon_data,
-                'tags': tags
-            }
-            
-            # Сохраняем в базу данных
-            self.address_repository.save_address(data)
-            
-            logging.info(f"Successfully processed address: {address}")
-            return True
-            
-        except Exception as e:
-            logging.error(f"Error processing address {address}: {str(e)}")
-            return False
-
     def run(self):
         try:
             # Получаем тег из переменных окружения
             test_tag = os.getenv('TEST_TAG')
-            tags = [test_tag] if test_tag else self.get_tags()
+            tags = [test_tag] if test_tag else self.checkpoint.remaining_tags()
+            if tags is None:
+                tags = self.get_tags()
+                self.checkpoint.start(tags)
+                self.registry.reset()
+            elif not test_tag:
+                self.logger.info("Продолжаем прерванный обход по чекпоинту")
             
             self.logger.info(f"Режим работы: {'ТЕСТОВЫЙ' if test_tag else 'ПРОД'}") 
             self.logger.info(f"Найдено тегов: {len(tags)}")
@@ -309,18 +242,190 @@ class EthplorerParser:
                 return
             
             # Собираем данные по каждому тегу
+            failed = []
             for tag in tags:
-                self.get_tag_data(tag)
-                self.logger.info(f"Обработан тег {tag}")
+                with profile_tag(tag):
+                    done = self.get_tag_data(tag)
+                if done:
+                    self.logger.info(f"Обработан тег {tag}")
+                else:
+                    failed.append(tag)
+            self.pipeline.drain()
+            # Теги, страницы которых конвейер не смог записать
+            failed += [tag for tag in self.checkpoint.unwritten_tags() if tag not in failed]
             
+            if failed:
+                # Необработанные теги останутся в чекпоинте до следующего запуска
+                # (до CHECKPOINT_MAX_ATTEMPTS попыток)
+                self.logger.warning(f"Теги с ошибками: {', '.join(failed)}")
+                if not test_tag:
+                    self.checkpoint.record_failures(failed)
+            if not test_tag and self.checkpoint.remaining_tags() is None:
+                # Все теги записаны или убраны после исчерпания попыток
+                self.registry.reset()
+                self.checkpoint.finish()
             self.logger.info("Все теги обработаны. Завершение работы.")
         
         except Exception as e:
             self.logger.error(f"Критическая ошибка: {e}")
         finally:
             self.close()
-            os._exit(0)
+
+    def load_queue_tags(self):
+        """Теги для заполнения очереди: с сайта (QUEUE_SEED=site) или из tags.csv"""
+        tags = []
+        if os.getenv('QUEUE_SEED', 'site').lower() == 'site':
+            tags = self.get_tags()
+        if not tags:
+            tags = list(read_tags_csv())
+        return tags
+
+    def run_queue(self):
+        """Режим очереди (CRAWL_MODE=queue): реплики делят теги через таблицу crawl_queue"""
+        try:
+            if self.db is None:
+                raise RuntimeError("Режим очереди требует БД (OUTPUT_SINKS с db)")
+            self.work_queue = TagWorkQueue(self.db)
+            self.work_queue.prepare()
+            while True:
+                wait = self.work_queue.seed(self.load_queue_tags)
+                if not wait:
+                    break
+                self.logger.info(f"Обход завершен недавно, следующий через {wait:.0f} с")
+                time.sleep(wait)
+
+            while True:
+                item = self.work_queue.claim()
+                if item is None:
+                    if not self.work_queue.unfinished():
+                        break
+                    # Оставшиеся задания держат другие реплики: ждем завершения или истечения аренды
+                    self.logger.info(f"Свободных заданий нет, повтор через {self.work_queue.poll_seconds} с")
+                    time.sleep(self.work_queue.poll_seconds)
+                    continue
+                self.logger.info(f"Взято задание: {item}")
+                with profile_tag(item.tag):
+                    done = self.get_tag_data(item.tag, checkpoint=item, last_page=item.last_page)
+                if done:
+                    self.logger.info(f"Обработан тег {item.tag}")
+                else:
+                    try:
+                        item.release()
+                    except Exception as e:
+                        # Задание вернется в очередь по истечении аренды
+                        self.logger.error(f"Ошибка возврата задания {item}: {e}")
+            self.pipeline.drain()
+            self.logger.info("Очередь пуста. Завершение работы.")
+
+        except Exception as e:
+            self.logger.error(f"Критическая ошибка: {e}")
+        finally:
+            self.close()
+
+def run_async():
+    """Параллельный обход тегов (PARSER_CONCURRENCY > 1 или FETCH_MODE=http), в том числе из очереди"""
+    from crawler.async_crawler import AsyncTagCrawler
+
+    setup_logging()
+    logger = logging.getLogger(__name__)
+    metrics = setup_metrics()
+    rate_limiter = AdaptiveRateLimiter()
+    metrics.gauge('rate_limit', lambda: rate_limiter.rate)
+    icon_cache = IconCache(rate_limiter=rate_limiter)
+    queue_mode = os.getenv('CRAWL_MODE', 'tags').lower() == 'queue'
+    registry = AddressRegistry(persistent=not queue_mode)
+    sink = None
+    pipeline = None
+    work_queue = None
+    try:
+        outputs = output_sinks()
+        db = None
+        address_repository = None
+        if 'db' in outputs:
+            db = Database(db_config_from_env())
+            address_repository = AddressRepository(db)
+            address_repository.prepare(read_tags_csv())
+        sink = create_sink(outputs, address_repository)
+        pipeline = Pipeline(sink, icon_cache, registry)
+        crawler = AsyncTagCrawler(CrawlCheckpoint(), rate_limiter, registry, pipeline)
+        if queue_mode:
+            if db is None:
+                raise RuntimeError("Режим очереди требует БД (OUTPUT_SINKS с db)")
+            work_queue = TagWorkQueue(db)
+            work_queue.prepare()
+            crawler.run_queue(work_queue)
+        else:
+            test_tag = os.getenv('TEST_TAG')
+            crawler.run([test_tag] if test_tag else None)
+    except Exception as e:
+        logger.error(f"Критическая ошибка: {e}")
+    finally:
+        # Дописываем очереди конвейера вместо жесткого выхода
+        if pipeline:
+            pipeline.close()
+        if sink:
+            sink.close()
+        if work_queue:
+            work_queue.close()
+        icon_cache.close()
+        registry.close()
+        metrics.close()
+
+def run_enrich():
+    """Дообогащение адресов из БД со страниц /address/<адрес> (CRAWL_MODE=enrich)"""
+    from crawler.enrich import AddressEnricher
+
+    setup_logging()
+    logger = logging.getLogger(__name__)
+    metrics = setup_metrics()
+    rate_limiter = AdaptiveRateLimiter()
+    metrics.gauge('rate_limit', lambda: rate_limiter.rate)
+    icon_cache = IconCache(rate_limiter=rate_limiter)
+    registry = AddressRegistry(persistent=False)
+    sink = None
+    pipeline = None
+    try:
+        outputs = output_sinks()
+        if 'db' not in outputs:
+            raise RuntimeError("Режим обогащения требует БД (OUTPUT_SINKS с db)")
+        address_repository = AddressRepository(Database(db_config_from_env()))
+        address_repository.prepare(read_tags_csv())
+        sink = create_sink(outputs, address_repository)
+        pipeline = Pipeline(sink, icon_cache, registry)
+        AddressEnricher(address_repository, rate_limiter, pipeline).run()
+    except Exception as e:
+        logger.error(f"Критическая ошибка обогащения: {e}")
+    finally:
+        if pipeline:
+            pipeline.close()
+        if sink:
+            sink.close()
+        icon_cache.close()
+        registry.close()
+        metrics.close()
+
+def run_load():
+    """Загрузка NDJSON-выгрузки в БД (CRAWL_MODE=load, файл - EXPORT_FILE)"""
+    setup_logging()
+    logger = logging.getLogger(__name__)
+    path = os.getenv('EXPORT_FILE', 'data/ethplorer_data.ndjson')
+    try:
+        address_repository = AddressRepository(Database(db_config_from_env()))
+        address_repository.prepare(read_tags_csv())
+        load_ndjson(path, address_repository)
+    except Exception as e:
+        logger.error(f"Критическая ошибка загрузки {path}: {e}")
 
 if __name__ == "__main__":
-    parser = EthplorerParser()
-    parser.run()
+    if os.getenv('CRAWL_MODE', 'tags').lower() == 'load':
+        run_load()
+    elif os.getenv('CRAWL_MODE', 'tags').lower() == 'enrich':
+        run_enrich()
+    elif int(os.getenv('PARSER_CONCURRENCY') or '1') > 1 or os.getenv('FETCH_MODE', 'browser').lower() == 'http':
+        run_async()
+    else:
+        parser = EthplorerParser()
+        if os.getenv('CRAWL_MODE', 'tags').lower() == 'queue':
+            parser.run_queue()
+        else:
+            parser.run()